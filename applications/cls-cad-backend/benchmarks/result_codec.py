@@ -0,0 +1,133 @@
+"""
+Compares the storage size and encoding/decoding latency of the result codecs on
+synthetic assemblies shaped like the output of postprocess.
+
+Run from the cls-cad-backend folder: python -m benchmarks.result_codec
+"""
+import argparse
+import json
+import random
+import uuid
+from timeit import default_timer as timer
+
+import bson
+from cls_cad_backend.database.codec import (
+    available_codec,
+    codecs,
+    decode_assemblies,
+    decode_assembly_bytes,
+    encode_assemblies,
+)
+
+
+def synthetic_assembly(rng: random.Random, documents: list[str], size: int) -> dict:
+    """
+    Creates an assembly with the same keys and value shapes as a post-processed term.
+
+    :param rng: The random number generator.
+    :param documents: The forgeDocumentIds to pick parts from.
+    :param size: The number of assembly instructions.
+    :return: The assembly.
+    """
+    used = [rng.choice(documents) for _ in range(size)]
+    return {
+        "name": "Assembly",
+        "cost": round(rng.uniform(1, 100), 2),
+        "count": size,
+        "quantities": {
+            document: {"count": used.count(document), "name": "Part", "cost": 1.0}
+            for document in set(used)
+        },
+        "links": size // 3 + 1,
+        "instructions": [
+            {
+                "target": str(uuid.UUID(int=rng.getrandbits(128))),
+                "source": str(uuid.UUID(int=rng.getrandbits(128))),
+                "move": document,
+                "count": 1,
+                "motion": rng.choice(["Rigid", "Revolute", "Slider"]),
+                "link": f"link{index // 3}",
+            }
+            for index, document in enumerate(used)
+        ],
+    }
+
+
+def measure(assemblies: list[dict], codec: str, chunk_size: int) -> dict:
+    """
+    Encodes all assemblies in chunks with one codec and decodes them again.
+
+    :param assemblies: The assemblies.
+    :param codec: The codec to measure.
+    :param chunk_size: The number of assemblies per chunk.
+    :return: The stored BSON size and the times in seconds for encoding, decoding into
+        assemblies, and decoding into compact JSON (as the results endpoints do).
+    """
+    chunks = [
+        assemblies[start : start + chunk_size]
+        for start in range(0, len(assemblies), chunk_size)
+    ]
+    start = timer()
+    documents = [encode_assemblies(chunk, codec) for chunk in chunks]
+    encoded = [bson.encode(document) for document in documents]
+    encode_time = timer() - start
+
+    start = timer()
+    for document in encoded:
+        decode_assemblies(bson.decode(document))
+    decode_time = timer() - start
+    start = timer()
+    for document in encoded:
+        decode_assembly_bytes(bson.decode(document))
+    decode_bytes_time = timer() - start
+
+    return {
+        "codec": available_codec(codec),
+        "bytes": sum(len(document) for document in encoded),
+        "encodeSeconds": encode_time,
+        "decodeSeconds": decode_time,
+        "decodeBytesSeconds": decode_bytes_time,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--assemblies", type=int, default=1000)
+    parser.add_argument("--instructions", type=int, default=20)
+    parser.add_argument("--parts", type=int, default=30)
+    parser.add_argument("--chunk-size", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print JSON instead.")
+    arguments = parser.parse_args()
+
+    rng = random.Random(arguments.seed)
+    documents = [
+        f"urn:adsk.wipprod:dm.lineage:{uuid.UUID(int=rng.getrandbits(128))}"
+        for _ in range(arguments.parts)
+    ]
+    assemblies = [
+        synthetic_assembly(rng, documents, arguments.instructions)
+        for _ in range(arguments.assemblies)
+    ]
+    measurements = [
+        measure(assemblies, codec, arguments.chunk_size)
+        for codec in dict.fromkeys(available_codec(codec) for codec in codecs)
+    ]
+
+    if arguments.json:
+        print(json.dumps(measurements, indent=2))
+        return
+    baseline = measurements[0]["bytes"]
+    print(
+        f"{'codec':>6} {'bytes':>12} {'ratio':>6} {'encode':>9} {'decode':>9} {'json':>9}"
+    )
+    for m in measurements:
+        print(
+            f"{m['codec']:>6} {m['bytes']:>12} {m['bytes'] / baseline:>6.2f} "
+            f"{m['encodeSeconds']:>8.3f}s {m['decodeSeconds']:>8.3f}s "
+            f"{m['decodeBytesSeconds']:>8.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Measures how synthesis scales: for every combination of the given parameters, a
+synthetic project is stored in the test database and requested via /request/assembly.
+The time spent in each phase (see /metrics) and the sizes of the repository, grammar
+and enumeration are written as one JSON line per request, for comparing clsp versions.
+
+Run from the cls-cad-backend folder:
+python -m benchmarks.synthesis --parts 10 50 --joints 1 2 --output synthesis.jsonl
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+from importlib import metadata
+from itertools import product
+from timeit import default_timer as timer
+
+import cls_cad_backend.server
+from benchmarks.synthetic_project import synthetic_project, synthetic_request
+from cls_cad_backend.database.commands import (
+    switch_to_test_database,
+    upsert_part,
+    upsert_taxonomy,
+)
+from cls_cad_backend.util.metrics import logger
+from fastapi.testclient import TestClient
+
+
+class TraceCollector(logging.Handler):
+    """
+    Collects the structured log lines of traced synthesis requests by request id.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.traces: dict[str, list[dict]] = {}
+
+    def emit(self, record: logging.LogRecord) -> None:
+        trace = json.loads(record.getMessage())
+        self.traces.setdefault(trace["requestId"], []).append(trace)
+
+
+def run_point(
+    client: TestClient, collector: TraceCollector, parameters: dict, repeats: int
+) -> list[dict]:
+    """
+    Stores a synthetic project and requests synthesis for it repeatedly. The first
+    request builds the repository, later ones reuse the cached one.
+
+    :param client: The client for the backend.
+    :param collector: Collects the traces of the requests.
+    :param parameters: The parameters of synthetic_project and synthetic_request.
+    :param repeats: How often to request synthesis.
+    :return: One measurement per request.
+    """
+    project_id = "benchmark-" + "-".join(f"{k}{v}" for k, v in parameters.items())
+    taxonomy, parts = synthetic_project(
+        project_id,
+        parts=parameters["parts"],
+        joints=parameters["joints"],
+        depth=parameters["depth"],
+        branching=parameters["branching"],
+        seed=parameters["seed"],
+    )
+    upsert_taxonomy(taxonomy)
+    for part in parts:
+        upsert_part(part)
+    request = synthetic_request(
+        parts, counts=parameters["counts"], page_size=parameters["pageSize"]
+    )
+
+    measurements = []
+    for repeat in range(repeats):
+        request_id = f"{project_id}-{repeat}"
+        start = timer()
+        response = client.post(
+            "/request/assembly?force=1",
+            json=request,
+            headers={"X-Request-ID": request_id},
+        )
+        seconds = timer() - start
+        body = response.json()
+        outcome, phases, sizes = None, {}, {}
+        for trace in collector.traces.pop(request_id, []):
+            outcome = trace["outcome"] or outcome
+            phases.update(trace["phases"])
+            sizes.update(trace["sizes"])
+        measurements.append(
+            {
+                **parameters,
+                "repeat": repeat,
+                "status": response.status_code,
+                "outcome": outcome,
+                "count": body.get("count", 0) if isinstance(body, dict) else 0,
+                "seconds": seconds,
+                "phases": phases,
+                "sizes": sizes,
+            }
+        )
+    return measurements
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--parts", type=int, nargs="+", default=[10, 40])
+    parser.add_argument("--joints", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--depth", type=int, nargs="+", default=[2])
+    parser.add_argument("--branching", type=int, nargs="+", default=[3])
+    parser.add_argument("--counts", type=int, nargs="+", default=[0, 1])
+    parser.add_argument("--page-size", type=int, nargs="+", default=[100])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Append the JSON lines to this file.")
+    arguments = parser.parse_args()
+
+    switch_to_test_database()
+    collector = TraceCollector()
+    logger.addHandler(collector)
+    client = TestClient(cls_cad_backend.server.app)
+    environment = {
+        "clsp": metadata.version("clsp"),
+        "python": platform.python_version(),
+    }
+
+    output = open(arguments.output, "a") if arguments.output else sys.stdout
+    try:
+        for parts, joints, depth, branching, counts, page_size in product(
+            arguments.parts,
+            arguments.joints,
+            arguments.depth,
+            arguments.branching,
+            arguments.counts,
+            arguments.page_size,
+        ):
+            parameters = {
+                "parts": parts,
+                "joints": joints,
+                "depth": depth,
+                "branching": branching,
+                "counts": counts,
+                "pageSize": page_size,
+                "seed": arguments.seed,
+            }
+            for measurement in run_point(
+                client, collector, parameters, arguments.repeats
+            ):
+                output.write(json.dumps({**measurement, **environment}) + "\n")
+                output.flush()
+    finally:
+        logger.removeHandler(collector)
+        cls_cad_backend.server.stop_workers()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+Generates synthetic projects (a taxonomy and parts, shaped like the JSON the Fusion 360
+Add-In submits) and synthesis requests for them, to measure how synthesis scales.
+
+Run from the cls-cad-backend folder to print a project as JSON:
+python -m benchmarks.synthetic_project --parts 20
+"""
+import argparse
+import json
+import random
+
+
+def taxonomy_tree(root: str, depth: int, branching: int) -> dict[str, list[str]]:
+    """
+    Creates a sub-taxonomy that is a complete tree below a root type.
+
+    :param root: The name of the root type, e.g. "Part".
+    :param depth: The number of levels below the root.
+    :param branching: The number of subtypes of each type.
+    :return: The sub-taxonomy, keyed on subtypes, as stored in the database.
+    """
+    tree = {root: []}
+    level = [root]
+    for _ in range(depth):
+        next_level = []
+        for parent in level:
+            for branch in range(branching):
+                child = f"{parent}x{branch}"
+                tree[child] = [parent]
+                next_level.append(child)
+        level = next_level
+    return tree
+
+
+def synthetic_project(
+    project_id: str,
+    *,
+    parts: int = 20,
+    joints: int = 2,
+    depth: int = 2,
+    branching: int = 3,
+    seed: int = 0,
+) -> tuple[dict, list[dict]]:
+    """
+    Creates a project whose parts form assemblies of configurable size. Every part
+    provides one leaf type of the part taxonomy, and requires up to joints types that
+    are provided by parts with a lower index, so that every request for a provided type
+    has results. The first tenth of the parts require nothing and end the assemblies.
+
+    :param project_id: The forgeProjectId of the project.
+    :param parts: The number of parts.
+    :param joints: The number of required JointOrigins per part.
+    :param depth: The depth of the part and format taxonomies.
+    :param branching: The number of subtypes per type in the taxonomies.
+    :param seed: The seed for the random choices.
+    :return: A tuple of the taxonomy JSON and the list of part JSONs.
+    """
+    rng = random.Random(seed)
+    sub_taxonomies = {
+        "parts": taxonomy_tree("Part", depth, branching),
+        "formats": taxonomy_tree("Format", depth, branching),
+        "attributes": taxonomy_tree("Attribute", 1, branching),
+    }
+    taxonomy = {
+        "_id": project_id,
+        "forgeProjectId": project_id,
+        "taxonomies": sub_taxonomies,
+        "mappings": {
+            key: {name: f"{project_id}-{key}-{name}" for name in sub_taxonomy}
+            for key, sub_taxonomy in sub_taxonomies.items()
+        },
+    }
+
+    def leaves(key: str) -> list[str]:
+        supertypes = set().union(*sub_taxonomies[key].values())
+        return [f"{t}_{key}" for t in sub_taxonomies[key] if t not in supertypes]
+
+    part_leaves, format_leaves = leaves("parts"), leaves("formats")
+    attribute_leaves = leaves("attributes")
+    terminals = max(1, parts // 10)
+    provided = [part_leaves[index % len(part_leaves)] for index in range(parts)]
+
+    part_list = []
+    for index in range(parts):
+        document_id = f"{project_id}-part{index}"
+        joint_origins = {
+            f"{document_id}-provides": {
+                "motion": "Rigid",
+                "count": 1,
+                "requires": [],
+                "provides": [
+                    provided[index],
+                    rng.choice(format_leaves),
+                    rng.choice(attribute_leaves),
+                ],
+            }
+        }
+        for joint in range(joints if index >= terminals else 0):
+            joint_origins[f"{document_id}-requires{joint}"] = {
+                "motion": rng.choice(["Rigid", "Revolute"]),
+                "count": rng.randint(1, 2),
+                "requires": [provided[rng.randrange(index)]],
+                "provides": [],
+            }
+        part_list.append(
+            {
+                "_id": document_id,
+                "configurations": [
+                    {
+                        "requiresJointOrigins": [
+                            name for name in joint_origins if "-requires" in name
+                        ],
+                        "providesJointOrigin": f"{document_id}-provides",
+                    }
+                ],
+                "meta": {
+                    "name": f"Part {index} v1",
+                    "forgeDocumentId": document_id,
+                    "forgeFolderId": f"{project_id}-folder",
+                    "forgeProjectId": project_id,
+                    "cost": round(rng.uniform(1, 100), 2),
+                    "availability": round(rng.uniform(0.5, 1), 2),
+                },
+                "jointOrigins": joint_origins,
+            }
+        )
+    return taxonomy, part_list
+
+
+def provided_type(part: dict) -> str:
+    """
+    Retrieves the part type a part of a synthetic project provides.
+
+    :param part: The part JSON, see synthetic_project.
+    :return: The suffixed part type.
+    """
+    return part["jointOrigins"][part["configurations"][0]["providesJointOrigin"]][
+        "provides"
+    ][0]
+
+
+def synthetic_request(
+    project_parts: list[dict],
+    *,
+    counts: int = 0,
+    count_limit: int = 4,
+    page_size: int = 100,
+) -> dict:
+    """
+    Creates a synthesis request for the type provided by the last part of a synthetic
+    project, which has the deepest assemblies.
+
+    :param project_parts: The parts of the project, see synthetic_project.
+    :param counts: The number of counting constraints, each limiting how often one of
+        the types provided by the last parts may be used.
+    :param count_limit: How often each counted type may be used.
+    :param page_size: The number of assemblies to enumerate.
+    :return: The synthesis request JSON.
+    """
+    provided = [provided_type(part) for part in reversed(project_parts)]
+    counted = list(dict.fromkeys(provided))[:counts]
+    return {
+        "forgeProjectId": project_parts[-1]["meta"]["forgeProjectId"],
+        "target": [provided[0]],
+        "name": "Benchmark Request",
+        "pageSize": page_size,
+        "partCounts": [
+            {
+                "partType": [counted_type],
+                "partNumber": count_limit,
+                "partCountName": f"count{index}",
+            }
+            for index, counted_type in enumerate(counted)
+        ]
+        or None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--project", default="benchmark")
+    parser.add_argument("--parts", type=int, default=20)
+    parser.add_argument("--joints", type=int, default=2)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--branching", type=int, default=3)
+    parser.add_argument("--counts", type=int, default=0)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    taxonomy, parts = synthetic_project(
+        arguments.project,
+        parts=arguments.parts,
+        joints=arguments.joints,
+        depth=arguments.depth,
+        branching=arguments.branching,
+        seed=arguments.seed,
+    )
+    request = synthetic_request(parts, counts=arguments.counts)
+    print(json.dumps({"taxonomy": taxonomy, "parts": parts, "request": request}))
+
+
+if __name__ == "__main__":
+    main()
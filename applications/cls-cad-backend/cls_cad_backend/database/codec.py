@@ -0,0 +1,78 @@
+import json
+import zlib
+
+from cls_cad_backend.util.json_encoding import json_bytes
+
+zstd_available = False
+try:  # pragma: no cover
+    import zstandard
+
+    zstd_available = True
+except ImportError:  # pragma: no cover
+    pass
+
+codecs = ("none", "zlib", "zstd")
+
+
+def available_codec(codec: str) -> str:
+    """
+    Falls back to zlib if zstd is requested but zstandard is not installed.
+
+    :param codec: One of "none", "zlib" or "zstd".
+    :return: The codec to actually use.
+    """
+    if codec not in codecs:
+        raise ValueError(f"Unknown result codec {codec}, expected one of {codecs}")
+    return "zlib" if codec == "zstd" and not zstd_available else codec
+
+
+def encode_assemblies(assemblies: list[dict], codec: str) -> dict:
+    """
+    Encodes a chunk of post-processed assemblies for storage. Compressed chunks store
+    the assemblies as compact JSON, one line per assembly, so they can later be served
+    without decoding them.
+
+    :param assemblies: The post-processed assemblies.
+    :param codec: One of "none", "zlib" or "zstd".
+    :return: The fields to store in the chunk document.
+    """
+    codec = available_codec(codec)
+    if codec == "none":
+        return {"interpretedTerms": assemblies}
+    lines = b"\n".join(json_bytes(assembly, pretty=False) for assembly in assemblies)
+    if codec == "zstd":
+        data = zstandard.ZstdCompressor().compress(lines)
+    else:
+        data = zlib.compress(lines)
+    return {"codec": codec, "data": data}
+
+
+def decode_assembly_bytes(chunk: dict) -> list[bytes]:
+    """
+    Decodes a stored chunk into the compact JSON of its assemblies.
+
+    :param chunk: The chunk document.
+    :return: One encoded value per assembly.
+    """
+    codec = chunk.get("codec", "none")
+    if codec == "none":
+        return [
+            json_bytes(assembly, pretty=False) for assembly in chunk["interpretedTerms"]
+        ]
+    if codec == "zstd":
+        lines = zstandard.ZstdDecompressor().decompress(chunk["data"])
+    else:
+        lines = zlib.decompress(chunk["data"])
+    return lines.split(b"\n") if lines else []
+
+
+def decode_assemblies(chunk: dict) -> list[dict]:
+    """
+    Decodes a stored chunk into its assemblies.
+
+    :param chunk: The chunk document.
+    :return: The post-processed assemblies.
+    """
+    if chunk.get("codec", "none") == "none":
+        return chunk["interpretedTerms"]
+    return [json.loads(line) for line in decode_assembly_bytes(chunk)]
@@ -1,21 +1,70 @@
 import configparser
+import hashlib
 import os
 import platform
 import zipfile
+from collections import defaultdict
 from tkinter.filedialog import askopenfilename
 from tkinter.messagebox import askyesno, showerror, showinfo
 from tkinter.simpledialog import askstring
 
+from cls_cad_backend.database.codec import (
+    decode_assemblies,
+    decode_assembly_bytes,
+    encode_assemblies,
+)
+from cls_cad_backend.settings import RESULT_CHUNK_SIZE, RESULT_CODEC
+from cls_cad_backend.util.json_encoding import json_bytes
 from montydb import MontyClient, set_storage
-from pymongo import MongoClient, errors
+from pymongo import ASCENDING, DESCENDING, MongoClient, errors
 from pymongo.collection import Collection
 
 database: MontyClient | MongoClient
 parts: Collection = None
 taxonomies: Collection = None
 results: Collection = None
+result_chunks: Collection = None
+summaries: Collection = None
+versions: Collection = None
+part_types: Collection = None
 storage_engine = "flatfile" if any(platform.win32_ver()) else "lightning"
 
+# The indexes every collection needs, each given as a list of (key, direction).
+declared_indexes: dict[str, list[list[tuple[str, int]]]] = {
+    "parts": [[("meta.forgeProjectId", ASCENDING)]],
+    "results": [[("forgeProjectId", ASCENDING), ("timestamp", DESCENDING)]],
+    "result_chunks": [[("resultId", ASCENDING), ("index", ASCENDING)]],
+    "summaries": [
+        [("forgeProjectId", ASCENDING), ("timestamp", DESCENDING)],
+        [("fingerprint", ASCENDING)],
+    ],
+    "part_types": [
+        [("forgeProjectId", ASCENDING), ("type", ASCENDING), ("role", ASCENDING)],
+        [("partId", ASCENDING)],
+    ],
+}
+
+# The queries that run on every synthesis or result listing, as collection, filter
+# and sort. Their query plans are part of the index report.
+frequent_queries: dict[str, tuple[str, dict, list[tuple[str, int]] | None]] = {
+    "get_all_parts_for_project": ("parts", {"meta.forgeProjectId": ""}, None),
+    "get_all_summaries_for_project": (
+        "summaries",
+        {"forgeProjectId": ""},
+        [("timestamp", DESCENDING)],
+    ),
+    "get_result_chunks": (
+        "result_chunks",
+        {"resultId": "", "index": {"$in": [0]}},
+        None,
+    ),
+    "get_joint_origins_for_types": (
+        "part_types",
+        {"forgeProjectId": "", "type": {"$in": [""]}, "role": ""},
+        None,
+    ),
+}
+
 
 def init_database():  # pragma: no cover
     """
@@ -28,7 +77,7 @@ def init_database():  # pragma: no cover
 
     :return:
     """
-    global database, parts, taxonomies, results
+    global database
     application_path = os.path.dirname(__file__)
     config_path = os.path.join(application_path, "config.ini")
     container_path = os.path.join(application_path, "container")
@@ -100,10 +149,101 @@ def init_database():  # pragma: no cover
             )
             database = MontyClient(os.path.join(application_path, "db"))
 
-    database = database["cls_cad_backend"]
+    bind_collections(database["cls_cad_backend"])
+
+
+def bind_collections(backend_database) -> None:
+    """
+    Attaches the module level collections to the collections of a database.
+
+    :param backend_database: The cls_cad_backend database of a MongoDB or MontyDB
+        client.
+    :return:
+    """
+    global database, parts, taxonomies, results, result_chunks, summaries, versions
+    global part_types
+    database = backend_database
     parts = database["parts"]
     taxonomies = database["taxonomies"]
     results = database["results"]
+    result_chunks = database["result_chunks"]
+    summaries = database["summaries"]
+    versions = database["versions"]
+    part_types = database["part_types"]
+    ensure_indexes()
+
+
+def ensure_indexes() -> None:
+    """
+    Creates all declared indexes that do not exist yet. MontyDB does not support
+    indexes, there this does nothing.
+
+    :return:
+    """
+    global database
+    for collection_name, indexes in declared_indexes.items():
+        for keys in indexes:
+            database[collection_name].create_index(keys)
+
+
+def index_report() -> dict:
+    """
+    Reports the declared and existing indexes of every collection, how often each index
+    was used, and which plan MongoDB chooses for the frequent queries. Only the declared
+    indexes are reported for MontyDB, as it does not support indexes.
+
+    :return: A JSON describing the indexes and query plans.
+    """
+    global database
+    report: dict = {"collections": {}, "queries": {}}
+    for collection_name, indexes in declared_indexes.items():
+        collection = database[collection_name]
+        entry = {"declared": [dict(keys) for keys in indexes]}
+        report["collections"][collection_name] = entry
+        if not isinstance(collection, Collection):
+            entry["supported"] = False
+            continue
+        entry["existing"] = {
+            name: dict(info["key"])
+            for name, info in collection.index_information().items()
+        }
+        try:
+            entry["usage"] = {
+                stats["name"]: stats["accesses"]["ops"]
+                for stats in collection.aggregate([{"$indexStats": {}}])
+            }
+        except errors.PyMongoError as err:
+            entry["usage"] = str(err)
+
+    for query_name, (collection_name, query, sort) in frequent_queries.items():
+        collection = database[collection_name]
+        if not isinstance(collection, Collection):
+            continue
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        report["queries"][query_name] = plan_stages(
+            cursor.explain()["queryPlanner"]["winningPlan"]
+        )
+    return report
+
+
+def plan_stages(plan: dict) -> list[str]:
+    """
+    Flattens a MongoDB query plan into its stages, e.g. ["FETCH", "IXSCAN
+    forgeProjectId_1_timestamp_-1"]. A COLLSCAN stage means no index was used.
+
+    :param plan: The winning plan of an explain output.
+    :return: The list of stages, outermost first.
+    """
+    stages = []
+    while plan:
+        stage = plan.get("stage", "")
+        if "indexName" in plan:
+            stage = f"{stage} {plan['indexName']}"
+        stages.append(stage)
+        plan = plan.get("inputStage") or next(iter(plan.get("inputStages", [])), None)
+    return stages
 
 
 def switch_to_test_database() -> None:
@@ -113,7 +253,7 @@ def switch_to_test_database() -> None:
 
     :return:
     """
-    global database, parts, taxonomies, results
+    global database
     application_path = os.path.dirname(__file__)
     set_storage(
         os.path.join(application_path, "test_db"),
@@ -122,21 +262,143 @@ def switch_to_test_database() -> None:
         map_size="1073741824",
     )
     database = MontyClient(os.path.join(application_path, "test_db"))
-    database = database["cls_cad_backend"]
-    parts = database["parts"]
-    taxonomies = database["taxonomies"]
-    results = database["results"]
+    bind_collections(database["cls_cad_backend"])
 
 
 def upsert_part(part: dict) -> None:
     """
-    Inserts a part into the database, indexed on its _id.
+    Inserts a part into the database, indexed on its _id, and updates the type index.
 
     :param part: The JSON of the part, containing an _id field.
     :return:
     """
     global parts
+    previous = parts.find_one({"_id": part["_id"]}, {"meta.forgeProjectId": 1})
     parts.replace_one({"_id": part["_id"]}, part, upsert=True)
+    index_part_types(part)
+    bump_project_version(part["meta"]["forgeProjectId"], "parts")
+    if (
+        previous
+        and previous["meta"]["forgeProjectId"] != part["meta"]["forgeProjectId"]
+    ):
+        bump_project_version(previous["meta"]["forgeProjectId"], "parts")
+
+
+def type_postings(part: dict) -> list[dict]:
+    """
+    Lists the entries of the type index for a part: one per type that a JointOrigin of
+    the part provides or requires, even if the JointOrigin lists the type repeatedly.
+
+    :param part: The JSON of the part.
+    :return: The index entries.
+    """
+    return [
+        {
+            "_id": f"{part['_id']}:{uuid}:{role}:{type_name}",
+            "forgeProjectId": part["meta"]["forgeProjectId"],
+            "partId": part["_id"],
+            "jointOrigin": uuid,
+            "role": role,
+            "type": type_name,
+        }
+        for uuid, joint_origin in part["jointOrigins"].items()
+        for role in ("provides", "requires")
+        for type_name in dict.fromkeys(joint_origin[role])
+    ]
+
+
+def index_part_types(part: dict) -> None:
+    """
+    Replaces the entries of a part in the type index.
+
+    :param part: The JSON of the part.
+    :return:
+    """
+    global part_types
+    part_types.delete_many({"partId": part["_id"]})
+    postings = type_postings(part)
+    if postings:
+        part_types.insert_many(postings)
+
+
+def ensure_type_index(forge_project_id: str) -> None:
+    """
+    Indexes all parts of a project that were stored before the type index existed.
+    This only happens once per project, afterwards upsert_part keeps the index current.
+
+    :param forge_project_id: The id of the project.
+    :return:
+    """
+    global versions
+    if (versions.find_one({"_id": forge_project_id}) or {}).get("typeIndexed"):
+        return
+    for part in get_all_parts_for_project(forge_project_id):
+        index_part_types(part)
+    versions.update_one(
+        {"_id": forge_project_id}, {"$set": {"typeIndexed": True}}, upsert=True
+    )
+
+
+def get_indexed_types(forge_project_id: str, role: str) -> dict[str, int]:
+    """
+    Retrieves which types the parts of a project provide or require.
+
+    :param forge_project_id: The id of the project.
+    :param role: Either "provides" or "requires".
+    :return: The number of parts providing (or requiring) each type.
+    """
+    global part_types
+    ensure_type_index(forge_project_id)
+    part_ids: defaultdict[str, set[str]] = defaultdict(set)
+    for posting in part_types.find(
+        {"forgeProjectId": forge_project_id, "role": role}, {"partId": 1, "type": 1}
+    ):
+        part_ids[posting["type"]].add(posting["partId"])
+    return {type_name: len(ids) for type_name, ids in sorted(part_ids.items())}
+
+
+def get_joint_origins_for_types(
+    forge_project_id: str, type_names: list[str], role: str
+) -> list[dict]:
+    """
+    Retrieves the JointOrigins of the parts of a project that provide or require any
+    of the given types.
+
+    :param forge_project_id: The id of the project.
+    :param type_names: The (suffixed) type names.
+    :param role: Either "provides" or "requires".
+    :return: JSONs containing partId, jointOrigin and type.
+    """
+    global part_types
+    ensure_type_index(forge_project_id)
+    return list(
+        part_types.find(
+            {
+                "forgeProjectId": forge_project_id,
+                "type": {"$in": type_names},
+                "role": role,
+            },
+            {"_id": 0, "partId": 1, "jointOrigin": 1, "type": 1},
+        ).sort([("partId", ASCENDING), ("jointOrigin", ASCENDING)])
+    )
+
+
+def get_provided_type_sets(forge_project_id: str) -> frozenset[frozenset[str]]:
+    """
+    Retrieves what the JointOrigins of the parts of a project provide.
+
+    :param forge_project_id: The id of the project.
+    :return: The distinct intersections of types provided by a JointOrigin.
+    """
+    global part_types
+    ensure_type_index(forge_project_id)
+    provided: defaultdict[tuple[str, str], set[str]] = defaultdict(set)
+    for posting in part_types.find(
+        {"forgeProjectId": forge_project_id, "role": "provides"},
+        {"partId": 1, "jointOrigin": 1, "type": 1},
+    ):
+        provided[posting["partId"], posting["jointOrigin"]].add(posting["type"])
+    return frozenset(frozenset(types) for types in provided.values())
 
 
 def upsert_taxonomy(taxonomy: dict) -> None:
@@ -148,17 +410,73 @@ def upsert_taxonomy(taxonomy: dict) -> None:
     """
     global taxonomies
     taxonomies.replace_one({"_id": taxonomy["_id"]}, taxonomy, upsert=True)
+    bump_project_version(taxonomy["_id"], "taxonomy")
+
+
+def bump_project_version(forge_project_id: str, kind: str) -> None:
+    """
+    Increments a content version counter of a project. Anything derived from the parts
+    or the taxonomy of a project (e.g. a cached repository) is keyed by these counters,
+    so incrementing them invalidates it.
+
+    :param forge_project_id: The id of the project that changed.
+    :param kind: Either "parts" or "taxonomy".
+    :return:
+    """
+    global versions
+    versions.update_one({"_id": forge_project_id}, {"$inc": {kind: 1}}, upsert=True)
+
+
+def get_project_versions(forge_project_id: str) -> tuple[int, int]:
+    """
+    Retrieve the content version counters of a project.
+
+    :param forge_project_id: The id of the project.
+    :return: A tuple of the part-set version and the taxonomy version. Both are 0 for
+        projects that never changed since versioning was introduced.
+    """
+    global versions
+    project_versions = versions.find_one({"_id": forge_project_id}) or {}
+    return project_versions.get("parts", 0), project_versions.get("taxonomy", 0)
 
 
 def upsert_result(result: dict) -> None:
     """
-    Inserts a result into the database, indexed on its _id.
+    Inserts a result into the database, indexed on its _id. The assemblies are stored
+    separately from the metadata, in chunks of RESULT_CHUNK_SIZE assemblies, so that
+    single assemblies can be read without loading the whole result, and large results
+    stay below the document size limit of MongoDB. Chunks are compressed according to
+    RESULT_CODEC. The metadata contains a hash of the assemblies, used as ETag.
 
     :param result: The JSON of the result, containing an _id field.
     :return:
     """
-    global results
-    results.replace_one({"_id": result["_id"]}, result, upsert=True)
+    global results, result_chunks
+    assemblies = result["interpretedTerms"]
+    chunks = [
+        {
+            "_id": f"{result['_id']}:{index}",
+            "resultId": result["_id"],
+            "forgeProjectId": result["forgeProjectId"],
+            "index": index,
+            **encode_assemblies(
+                assemblies[start : start + RESULT_CHUNK_SIZE], RESULT_CODEC
+            ),
+        }
+        for index, start in enumerate(range(0, len(assemblies), RESULT_CHUNK_SIZE))
+    ]
+    for chunk in chunks:
+        result_chunks.replace_one({"_id": chunk["_id"]}, chunk, upsert=True)
+    result_chunks.delete_many(
+        {"resultId": result["_id"], "index": {"$gte": len(chunks)}}
+    )
+    header = {key: value for key, value in result.items() if key != "interpretedTerms"}
+    header.update(
+        count=len(assemblies),
+        chunkSize=RESULT_CHUNK_SIZE,
+        contentHash=hashlib.sha256(json_bytes(assemblies, pretty=False)).hexdigest(),
+    )
+    results.replace_one({"_id": result["_id"]}, header, upsert=True)
 
 
 def get_all_parts_for_project(forge_project_id: str):
@@ -204,7 +522,191 @@ def get_result_for_id_in_project(result_id: str, forge_project_id: str):
     :return: The JSON of the result to retrieve, or None if it does not exist.
     """
     global results
-    return results.find_one({"_id": result_id, "forgeProjectId": forge_project_id})
+    return with_assemblies(
+        results.find_one({"_id": result_id, "forgeProjectId": forge_project_id})
+    )
+
+
+def get_result_header_for_id_in_project(result_id: str, forge_project_id: str):
+    """
+    Get the metadata of a single result contained within a specific project, without
+    its assemblies. A result stored in a single document is migrated to chunks first.
+
+    :param result_id: The id of the result.
+    :param forge_project_id: The id of the project the result should be present in.
+    :return: The JSON of the result, containing count, chunkSize and contentHash fields
+        instead of the assemblies, or None if it does not exist.
+    """
+    global results
+    query = {"_id": result_id, "forgeProjectId": forge_project_id}
+    header = results.find_one(query, {"interpretedTerms": 0})
+    if header is not None and "chunkSize" not in header:
+        upsert_result(results.find_one(query))
+        header = results.find_one(query)
+    return header
+
+
+def get_result_chunks(
+    result_id: str, forge_project_id: str, indices: list[int], *, encoded=False
+):
+    """
+    Get some chunks of the assemblies of a result. Only these chunks are decompressed.
+
+    :param result_id: The id of the result.
+    :param forge_project_id: The id of the project the result is in.
+    :param indices: The indices of the chunks to get.
+    :param encoded: Whether to return each assembly as compact JSON instead.
+    :return: A dictionary of chunk index to the list of assemblies in that chunk.
+    """
+    global result_chunks
+    decode = decode_assembly_bytes if encoded else decode_assemblies
+    return {
+        chunk["index"]: decode(chunk)
+        for chunk in result_chunks.find(
+            {
+                "resultId": result_id,
+                "forgeProjectId": forge_project_id,
+                "index": {"$in": list(indices)},
+            }
+        )
+    }
+
+
+def with_assemblies(result: dict | None) -> dict | None:
+    """
+    Adds all assemblies of a result stored in chunks back to the result.
+
+    :param result: The JSON of the result as stored in the results collection.
+    :return: The JSON of the result with the interpretedTerms field.
+    """
+    global result_chunks
+    if result is None or "interpretedTerms" in result:
+        return result
+    chunks = result_chunks.find({"resultId": result["_id"]}).sort("index", 1)
+    result = {
+        key: value
+        for key, value in result.items()
+        if key not in ("chunkSize", "contentHash")
+    }
+    result["interpretedTerms"] = [
+        assembly for chunk in chunks for assembly in decode_assemblies(chunk)
+    ]
+    return result
+
+
+def migrate_results_to_chunks() -> int:
+    """
+    Migrates all results stored in a single document to the chunked layout, see
+    upsert_result.
+
+    :return: The number of migrated results.
+    """
+    global results
+    migrated = 0
+    for result_id in results.distinct("_id", {"chunkSize": {"$exists": False}}):
+        upsert_result(results.find_one({"_id": result_id}))
+        migrated += 1
+    return migrated
+
+
+def upsert_summary(summary: dict) -> None:
+    """
+    Inserts the summary of a result into the database, indexed on the _id of the result.
+
+    :param summary: The JSON of the summary, containing an _id field.
+    :return:
+    """
+    global summaries
+    summaries.replace_one({"_id": summary["_id"]}, summary, upsert=True)
+
+
+def get_all_summaries_for_project(forge_project_id: str):
+    """
+    Get the summaries of all results for a specific project id, newest first.
+
+    :param forge_project_id: The project id to get summaries for.
+    :return: The set of summary JSON files.
+    """
+    global summaries
+    return summaries.find({"forgeProjectId": forge_project_id}).sort("timestamp", -1)
+
+
+def get_summary_for_id_in_project(result_id: str, forge_project_id: str):
+    """
+    Get the summary of a single result contained within a specific project.
+
+    :param result_id: The id of the result.
+    :param forge_project_id: The id of the project the result should be present in.
+    :return: The JSON of the summary, or None if it does not exist.
+    """
+    global summaries
+    return summaries.find_one({"_id": result_id, "forgeProjectId": forge_project_id})
+
+
+def get_summary_for_fingerprint(forge_project_id: str, fingerprint: str):
+    """
+    Get the summary of the newest result of a synthesis request with a specific
+    fingerprint.
+
+    :param forge_project_id: The id of the project of the synthesis request.
+    :param fingerprint: The fingerprint of the synthesis request.
+    :return: The JSON of the summary, or None if there is no such result.
+    """
+    global summaries
+    return next(
+        iter(
+            summaries.find(
+                {"forgeProjectId": forge_project_id, "fingerprint": fingerprint}
+            )
+            .sort("timestamp", -1)
+            .limit(1)
+        ),
+        None,
+    )
+
+
+def get_unsummarized_results_for_project(forge_project_id: str):
+    """
+    Get all results of a specific project id that were stored before results got
+    summaries.
+
+    :param forge_project_id: The project id to get results for.
+    :return: The set of result JSON files without a summary.
+    """
+    global results, summaries
+    summarized = summaries.distinct("_id", {"forgeProjectId": forge_project_id})
+    return map(
+        with_assemblies,
+        results.find({"forgeProjectId": forge_project_id, "_id": {"$nin": summarized}}),
+    )
+
+
+def results_summarized(forge_project_id: str) -> bool:
+    """
+    Checks whether the results of a project that were stored before results got
+    summaries were already summarized, see mark_results_summarized.
+
+    :param forge_project_id: The id of the project.
+    :return: True if there are no such results left.
+    """
+    global versions
+    return bool(
+        (versions.find_one({"_id": forge_project_id}) or {}).get("resultsSummarized")
+    )
+
+
+def mark_results_summarized(forge_project_id: str) -> None:
+    """
+    Records that all results of a project have summaries. Afterwards, upsert_summary is
+    called whenever a result is stored, so this only has to happen once per project.
+
+    :param forge_project_id: The id of the project.
+    :return:
+    """
+    global versions
+    versions.update_one(
+        {"_id": forge_project_id}, {"$set": {"resultsSummarized": True}}, upsert=True
+    )
 
 
 def get_taxonomy_for_project(forge_project_id: str):
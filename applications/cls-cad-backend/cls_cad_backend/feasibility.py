@@ -0,0 +1,77 @@
+from collections.abc import Iterable
+
+from cls_cad_backend.database.commands import (
+    get_project_versions,
+    get_provided_type_sets,
+)
+from cls_cad_backend.schemas import SynthesisRequestInf
+from cls_cad_backend.settings import PROVIDED_TYPES_CACHE_SIZE
+from cls_cad_backend.util.cache import LRUCache
+from cls_cad_backend.util.subtypes import Taxonomy
+
+# The distinct intersections of types provided by the JointOrigins of recently
+# requested projects, keyed on (project id, parts version).
+provided_types_cache = LRUCache(PROVIDED_TYPES_CACHE_SIZE)
+
+
+def project_provided_types(project_id: str) -> frozenset[frozenset[str]]:
+    """
+    Retrieves what the JointOrigins of the parts of a project provide, from the type
+    index of the project, see get_provided_type_sets. This includes JointOrigins that
+    are not provided by any configuration, which only makes the check more lenient.
+
+    :param project_id: The id of the project.
+    :return: The distinct intersections of provided types.
+    """
+    return provided_types_cache.get_or_compute(
+        (project_id, get_project_versions(project_id)[0]),
+        lambda: get_provided_type_sets(project_id),
+    )
+
+
+def unsatisfiable_constraints(
+    payload: SynthesisRequestInf,
+    provided: Iterable[frozenset[str]],
+    taxonomy: Taxonomy,
+) -> list[dict]:
+    """
+    Statically checks whether a synthesis request can have results at all, without
+    building a repository. A request is infeasible if no part configuration provides
+    (subtypes of) all targets, or if a counting constraint requires parts of a type
+    that no part configuration provides. Passing the check does not guarantee results.
+
+    :param payload: The synthesis request.
+    :param provided: The intersections of types provided by the parts of the project,
+        see project_provided_types.
+    :param taxonomy: The taxonomy of the project.
+    :return: One JSON per unsatisfiable target or counting constraint, containing a
+        human-readable reason. Empty if the request may have results.
+    """
+    provided = list(provided)
+
+    def is_provided(required: Iterable[str]) -> bool:
+        return any(taxonomy.satisfies(types, required) for types in provided)
+
+    reasons = [
+        {"target": target, "reason": f"No part provides {target} or a subtype of it."}
+        for target in dict.fromkeys(payload.target)
+        if not is_provided([target])
+    ]
+    if not reasons and not is_provided(payload.target):
+        reasons.append(
+            {
+                "target": payload.target,
+                "reason": f"No part provides all of {', '.join(payload.target)}.",
+            }
+        )
+    for part_count in payload.partCounts or []:
+        if part_count.partNumber > 0 and not is_provided(part_count.partType):
+            reasons.append(
+                {
+                    "partCount": part_count.partCountName,
+                    "reason": f"{part_count.partNumber} parts providing "
+                    f"{', '.join(part_count.partType)} are required, but no part "
+                    "provides them.",
+                }
+            )
+    return reasons
@@ -0,0 +1,322 @@
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from enum import Enum
+from functools import partial
+from threading import Lock
+from timeit import default_timer as timer
+
+from cls_cad_backend.database.commands import (
+    get_all_parts_for_project,
+    get_taxonomy_for_project,
+)
+from cls_cad_backend.repository_builder import RepositoryBuilder, relevant_parts
+from cls_cad_backend.results import store_result
+from cls_cad_backend.schemas import SynthesisRequestInf
+from cls_cad_backend.settings import JOB_RETENTION_SECONDS, SYNTHESIS_WORKERS
+from cls_cad_backend.synthesis import (
+    load_taxonomy,
+    part_counts_of,
+    result_document,
+    result_metadata,
+    synthesize,
+)
+from cls_cad_backend.util.hrid import generate_id
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    building = "building"
+    inhabiting = "inhabiting"
+    enumerating = "enumerating"
+    persisting = "persisting"
+    done = "done"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+finished_statuses = (JobStatus.done, JobStatus.failed, JobStatus.cancelled)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+executor: ProcessPoolExecutor | None = None
+manager = None
+statuses = None
+cancellations = None
+jobs: dict[str, dict] = {}
+jobs_lock = Lock()
+
+
+def start_pool() -> None:
+    """
+    Lazily starts the worker processes and the manager process that shares the job
+    statuses and cancellations between them and the backend.
+
+    :return:
+    """
+    global executor, manager, statuses, cancellations
+    with jobs_lock:
+        if executor is None:
+            manager = multiprocessing.Manager()
+            statuses = manager.dict()
+            cancellations = manager.dict()
+            executor = ProcessPoolExecutor(max_workers=SYNTHESIS_WORKERS)
+
+
+def shutdown_pool() -> None:
+    """
+    Stops all worker processes, cancelling queued and running jobs. Jobs keep their
+    final status, so they can still be queried afterwards.
+
+    :return:
+    """
+    global executor, manager, statuses, cancellations
+    with jobs_lock:
+        if executor is not None:
+            for job in jobs.values():
+                if job["finished"] is None:
+                    job["status"] = JobStatus.cancelled
+                    job["finished"] = timer()
+            executor.shutdown(wait=False, cancel_futures=True)
+            manager.shutdown()
+        executor, manager, statuses, cancellations = None, None, None, None
+
+
+def run_job(
+    job_id: str,
+    payload: dict,
+    parts: list[dict],
+    taxonomy: dict,
+    job_statuses,
+    job_cancellations,
+) -> list[dict]:
+    """
+    Executes a synthesis request inside a worker process. Worker processes do not access
+    the database, all parts and the taxonomy are passed along with the request. Terms
+    are post-processed within the worker, the pool itself already runs in parallel. The
+    current phase is reported through the shared status dictionary. Cancellation is
+    checked between phases and between enumerated terms.
+
+    :param job_id: The id of the job.
+    :param payload: The synthesis request as JSON.
+    :param parts: All part JSONs of the project.
+    :param taxonomy: The taxonomy JSON of the project.
+    :param job_statuses: The shared dictionary of job statuses.
+    :param job_cancellations: The shared dictionary of cancelled job ids.
+    :return: The post-processed assemblies.
+    """
+
+    def on_phase(phase: str):
+        if job_id in job_cancellations:
+            raise JobCancelled()
+        if job_statuses.get(job_id) != phase:
+            job_statuses[job_id] = JobStatus(phase).value
+
+    on_phase(JobStatus.building)
+    request = SynthesisRequestInf(**payload)
+    subtypes = load_taxonomy(taxonomy)
+    repository = RepositoryBuilder.add_parts_to_repository(
+        relevant_parts(parts, request.target, subtypes),
+        subtypes,
+        part_counts=part_counts_of(request),
+    )
+    return synthesize(
+        request,
+        subtypes,
+        repository,
+        max_count=request.pageSize,
+        on_phase=on_phase,
+        parallel=False,
+    )
+
+
+def submit_job(payload: SynthesisRequestInf, fingerprint: str | None = None) -> str:
+    """
+    Queues a synthesis request for execution in the worker pool. If a job for the same
+    request (same fingerprint) is still queued or running, no new job is queued. The
+    parts and taxonomy of the project are read without holding the lock of the jobs, so
+    another job for the same request may be queued meanwhile, which is checked again.
+
+    :param payload: The synthesis request.
+    :param fingerprint: The fingerprint of the request to store with the result, see
+        request_fingerprint.
+    :return: The id of the job, or of the job it was coalesced with.
+    """
+    start_pool()
+    prune_jobs()
+    with jobs_lock:
+        job_id = running_job(fingerprint)
+    if job_id is not None:
+        return job_id
+    parts = list(get_all_parts_for_project(payload.forgeProjectId))
+    taxonomy = get_taxonomy_for_project(payload.forgeProjectId)
+    with jobs_lock:
+        job_id = running_job(fingerprint)
+        if job_id is not None:
+            return job_id
+        job_id = generate_id()
+        statuses[job_id] = JobStatus.queued.value
+        future = executor.submit(
+            run_job,
+            job_id,
+            payload.model_dump(),
+            parts,
+            taxonomy,
+            statuses,
+            cancellations,
+        )
+        jobs[job_id] = {
+            "payload": payload,
+            "fingerprint": fingerprint,
+            "future": future,
+            "finished": None,
+        }
+    future.add_done_callback(partial(finish_job, job_id))
+    return job_id
+
+
+def running_job(fingerprint: str | None) -> str | None:
+    """
+    Finds a job for a request that is still queued or running. Has to be called while
+    holding the lock of the jobs.
+
+    :param fingerprint: The fingerprint of the request, see request_fingerprint.
+    :return: The id of the job, or None if there is none (or no fingerprint).
+    """
+    if fingerprint is None:
+        return None
+    for job_id, job in jobs.items():
+        if (
+            job["fingerprint"] == fingerprint
+            and job["finished"] is None
+            and job_id not in cancellations
+        ):
+            return job_id
+    return None
+
+
+def report_status(job_id: str, status: JobStatus) -> None:
+    """
+    Shares the status of a job with the backend, if the worker pool is still running.
+
+    :param job_id: The id of the job.
+    :param status: The new status.
+    :return:
+    """
+    job_statuses = statuses
+    if job_statuses is not None:
+        job_statuses[job_id] = status.value
+
+
+def finish_job(job_id: str, future: Future) -> None:
+    """
+    Called once a job stops executing. Persists the results of successful jobs, else
+    records why the job did not succeed. The final status is kept with the job.
+
+    :param job_id: The id of the job.
+    :param future: The future of the job.
+    :return:
+    """
+    job = jobs[job_id]
+    if job["finished"] is not None:
+        return
+    status = JobStatus.failed
+    try:
+        job_cancellations = cancellations
+        if future.cancelled() or (
+            job_cancellations is not None and job_id in job_cancellations
+        ):
+            raise JobCancelled()
+        interpreted_terms = future.result()
+        if not interpreted_terms:
+            job["result"] = "FAIL"
+        else:
+            report_status(job_id, JobStatus.persisting)
+            result = result_document(
+                generate_id(),
+                job["payload"],
+                interpreted_terms,
+                fingerprint=job["fingerprint"],
+            )
+            store_result(result)
+            job["result"] = result_metadata(result)
+        status = JobStatus.done
+    except JobCancelled:
+        status = JobStatus.cancelled
+    except Exception as e:
+        job["error"] = repr(e)
+    finally:
+        report_status(job_id, status)
+        job["status"] = status
+        job["finished"] = timer()
+
+
+def job_status(job_id: str, job: dict) -> JobStatus:
+    """
+    Retrieves the status of a job. Finished jobs keep their final status, unfinished
+    jobs report their current phase through the worker pool.
+
+    :param job_id: The id of the job.
+    :param job: The job.
+    :return: The status.
+    """
+    if "status" in job:
+        return job["status"]
+    return JobStatus(statuses[job_id])
+
+
+def get_job(job_id: str) -> dict | None:
+    """
+    Describes the current state of a job.
+
+    :param job_id: The id of the job.
+    :return: A JSON containing the status, and the result metadata (or FAIL) once the
+        job is done. None if the job does not exist.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return None
+    description = {"_id": job_id, "status": job_status(job_id, job).value}
+    for key in ("result", "error"):
+        if key in job:
+            description[key] = job[key]
+    return description
+
+
+def cancel_job(job_id: str) -> dict | None:
+    """
+    Cancels a job. Queued jobs are removed from the queue, running jobs stop at the next
+    phase or enumerated term (inhabitation itself can not be interrupted).
+
+    :param job_id: The id of the job.
+    :return: The state of the job after cancelling, None if the job does not exist.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        return None
+    if job_status(job_id, job) not in finished_statuses:
+        cancellations[job_id] = True
+        job["future"].cancel()
+    return get_job(job_id)
+
+
+def prune_jobs() -> None:
+    """
+    Forgets jobs that finished longer ago than the configured retention time.
+
+    :return:
+    """
+    now = timer()
+    with jobs_lock:
+        for job_id in [
+            job_id
+            for job_id, job in jobs.items()
+            if job["finished"] is not None
+            and now - job["finished"] > JOB_RETENTION_SECONDS
+        ]:
+            del jobs[job_id]
+            if statuses is not None:
+                statuses.pop(job_id, None)
+                cancellations.pop(job_id, None)
@@ -0,0 +1,290 @@
+import heapq
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator
+from itertools import count
+from typing import Any, NamedTuple
+
+
+class Rule(NamedTuple):
+    """
+    A rule of a tree grammar: the terminal (a Part) applied to literal arguments (part
+    counts, already as terms) and to terms derived from the argument nonterminals.
+    """
+
+    nonterminal: Any
+    terminal: Any
+    literals: tuple
+    arguments: tuple
+
+
+class Ranking(NamedTuple):
+    """
+    How assemblies are ranked, as a penalty to minimize. The penalty of an assembly is
+    the total of the weights of its parts, each scaled by the multiplicities of all
+    JointOrigins on its path if multiplicities count. It never decreases when parts are
+    added to an assembly, so the penalty of a partial assembly is a lower bound for all
+    its completions.
+    """
+
+    weight: Callable[[Any], float]
+    counts_multiplicities: bool
+    total: Callable[[Iterable[float]], float]
+    empty: float
+
+
+rankings = {
+    "cost": Ranking(lambda part: part.info["cost"], True, sum, 0.0),
+    "availability": Ranking(
+        lambda part: 1 - part.info["availability"], False, max, float("-inf")
+    ),
+}
+
+
+def grammar_items(grammar) -> Iterable[tuple[Any, Iterable]]:
+    """
+    Retrieves the rules of a tree grammar returned by clsp per nonterminal.
+
+    :param grammar: The tree grammar.
+    :return: Pairs of nonterminals and their rules.
+    """
+    if hasattr(grammar, "as_tuples"):
+        return grammar.as_tuples()
+    return grammar.items()
+
+
+def grammar_rules(grammar) -> dict[Any, list[Rule]]:
+    """
+    Normalizes the rules of a tree grammar returned by clsp. Literal parameters become
+    leaf terms, like in enumerated terms, and parameters bound to term variables become
+    arguments (derived from the nonterminal the binder assigns them). Literal variables
+    are instantiated during inhabitation, so predicates on them (like the part counts
+    of counted repositories, see RepositoryBuilder) are decided here and rules whose
+    predicates fail are dropped. Predicates that depend on term variables can not be
+    decided before a term is complete, the RepositoryBuilder never creates them.
+
+    :param grammar: The tree grammar.
+    :return: The rules per nonterminal.
+    """
+    rules = {}
+    for nonterminal, right_hand_sides in grammar_items(grammar):
+        rules[nonterminal] = []
+        for rule in right_hand_sides:
+            if isinstance(rule, tuple):
+                terminal, arguments = rule
+                rules[nonterminal].append(
+                    Rule(nonterminal, terminal, (), tuple(arguments))
+                )
+                continue
+            if not all(
+                literal_predicate_holds(predicate)
+                for predicate in getattr(rule, "predicates", None) or ()
+            ):
+                continue
+            binder = getattr(rule, "binder", None) or {}
+            literals = tuple(
+                (parameter.value, ())
+                for parameter in rule.parameters
+                if hasattr(parameter, "value")
+            )
+            bound = tuple(
+                binder[parameter.name]
+                for parameter in rule.parameters
+                if not hasattr(parameter, "value")
+            )
+            rules[nonterminal].append(
+                Rule(nonterminal, rule.terminal, literals, (*bound, *rule.args))
+            )
+    return rules
+
+
+def literal_predicate_holds(predicate) -> bool:
+    """
+    Decides a predicate of a rule on the instantiated literal variables. Functions
+    that compute the value of a literal variable (AsRaw) instead of deciding something
+    already hold, as clsp instantiated the variable with their value.
+
+    :param predicate: The predicate, either a function of the variable assignment or
+        an object with such a function (predicate) and the assignment of the literal
+        variables (predicate_substs).
+    :return: Whether the predicate holds.
+    :raises ValueError: If the predicate depends on a term variable.
+    """
+    function = getattr(predicate, "predicate", predicate)
+    substitution = dict(getattr(predicate, "predicate_substs", None) or {})
+    try:
+        holds = function(substitution)
+    except KeyError as e:
+        raise ValueError(
+            f"Ranking rules whose predicates use term variables is unsupported ({e})"
+        ) from e
+    return holds if isinstance(holds, bool) else True
+
+
+def argument_multiplicities(ranking: Ranking, rule: Rule) -> list[int]:
+    """
+    Retrieves by how much the penalty of each argument of a rule is scaled.
+
+    :param ranking: The ranking.
+    :param rule: The rule.
+    :return: The multiplicities of the required JointOrigins of the part, in the order
+        of the arguments, or 1 for all arguments if multiplicities do not count.
+    """
+    if not ranking.counts_multiplicities:
+        return [1] * len(rule.arguments)
+    return [
+        joint_origin_info["count"]
+        for joint_origin_info in rule.terminal.info["requiredJointOriginsInfo"].values()
+    ]
+
+
+def lower_bounds(rules: dict[Any, list[Rule]], ranking: Ranking) -> dict[Any, float]:
+    """
+    Computes the smallest penalty of any term derivable from each nonterminal,
+    bottom-up from the rules without arguments (Knuth's generalization of Dijkstra's
+    algorithm, as penalties never decrease when parts are added).
+
+    :param rules: The rules per nonterminal, see grammar_rules.
+    :param ranking: The ranking.
+    :return: The smallest penalty per nonterminal. Nonterminals that derive no term
+        are left out.
+    """
+    bounds: dict[Any, float] = {}
+    missing: dict[int, int] = {}
+    dependents: defaultdict[Any, list[Rule]] = defaultdict(list)
+    candidates: list[tuple[float, int, Any]] = []
+    tiebreaker = count()
+
+    def rule_bound(rule: Rule) -> float:
+        return ranking.total(
+            [
+                ranking.weight(rule.terminal),
+                *(
+                    multiplicity * bounds[argument]
+                    for multiplicity, argument in zip(
+                        argument_multiplicities(ranking, rule), rule.arguments
+                    )
+                ),
+            ]
+        )
+
+    for nonterminal_rules in rules.values():
+        for rule in nonterminal_rules:
+            arguments = set(rule.arguments)
+            missing[id(rule)] = len(arguments)
+            for argument in arguments:
+                dependents[argument].append(rule)
+            if not arguments:
+                heapq.heappush(
+                    candidates, (rule_bound(rule), next(tiebreaker), rule.nonterminal)
+                )
+
+    while candidates:
+        bound, _, nonterminal = heapq.heappop(candidates)
+        if nonterminal in bounds:
+            continue
+        bounds[nonterminal] = bound
+        for rule in dependents[nonterminal]:
+            missing[id(rule)] -= 1
+            if missing[id(rule)] == 0 and rule.nonterminal not in bounds:
+                heapq.heappush(
+                    candidates, (rule_bound(rule), next(tiebreaker), rule.nonterminal)
+                )
+    return bounds
+
+
+def ranked_terms(start, grammar, ranking: Ranking) -> Iterator[tuple]:
+    """
+    Enumerates the terms of a tree grammar best first, i.e., by ascending penalty.
+    Partial terms are expanded from a priority queue, ordered by the penalty of their
+    parts plus the lower bounds of their open nonterminals (see lower_bounds). As these
+    bounds are exact for single nonterminals and never overestimate, every term is
+    yielded only after all terms with a smaller penalty, and the first terms need few
+    expansions.
+
+    :param start: The start nonterminal, i.e., the query that was inhabited.
+    :param grammar: The tree grammar returned by clsp.
+    :param ranking: The ranking, see rankings.
+    :return: An iterator over the distinct terms, best first.
+    """
+    rules = grammar_rules(grammar)
+    bounds = lower_bounds(rules, ranking)
+    if start not in bounds:
+        return
+    expansions = {
+        nonterminal: [
+            (rule, argument_multiplicities(ranking, rule))
+            for rule in nonterminal_rules
+            if all(argument in bounds for argument in rule.arguments)
+        ]
+        for nonterminal, nonterminal_rules in rules.items()
+    }
+
+    # A partial term is the list of applied rules in preorder (as a linked list, last
+    # rule first) and the stack of open nonterminals with the multiplicity of their
+    # path (also linked, next nonterminal first).
+    tiebreaker = count()
+    queue = [(bounds[start], next(tiebreaker), ranking.empty, ((start, 1), None), None)]
+    seen = set()
+    while queue:
+        _, _, penalty, open_nonterminals, applied = heapq.heappop(queue)
+        if open_nonterminals is None:
+            term = build_term(applied)
+            if term not in seen:
+                seen.add(term)
+                yield term
+            continue
+        (nonterminal, multiplicity), rest = open_nonterminals
+        for rule, multiplicities in expansions[nonterminal]:
+            expanded_penalty = ranking.total(
+                [penalty, multiplicity * ranking.weight(rule.terminal)]
+            )
+            expanded = rest
+            for argument, argument_multiplicity in reversed(
+                list(zip(rule.arguments, multiplicities))
+            ):
+                expanded = ((argument, multiplicity * argument_multiplicity), expanded)
+            heapq.heappush(
+                queue,
+                (
+                    ranking.total([expanded_penalty, *open_bounds(expanded, bounds)]),
+                    next(tiebreaker),
+                    expanded_penalty,
+                    expanded,
+                    (rule, applied),
+                ),
+            )
+
+
+def open_bounds(open_nonterminals, bounds: dict[Any, float]) -> Iterator[float]:
+    """
+    Computes the lower bounds of the open nonterminals of a partial term.
+
+    :param open_nonterminals: The linked stack of open nonterminals, see ranked_terms.
+    :param bounds: The lower bounds per nonterminal.
+    :return: The bound of each open nonterminal, scaled by its multiplicity.
+    """
+    while open_nonterminals is not None:
+        (nonterminal, multiplicity), open_nonterminals = open_nonterminals
+        yield multiplicity * bounds[nonterminal]
+
+
+def build_term(applied) -> tuple:
+    """
+    Builds a term from the rules applied to derive it.
+
+    :param applied: The linked list of applied rules in preorder, last rule first.
+    :return: The term, a tuple of a terminal and its arguments, like the terms that
+        clsp enumerates.
+    """
+    rules = []
+    while applied is not None:
+        rule, applied = applied
+        rules.append(rule)
+    rules.reverse()
+    remaining = iter(rules)
+
+    def build() -> tuple:
+        rule = next(remaining)
+        return rule.terminal, (*rule.literals, *(build() for _ in rule.arguments))
+
+    return build()
@@ -1,17 +1,29 @@
-import json
-from collections import OrderedDict, defaultdict
-from collections.abc import Mapping
+from collections import OrderedDict, defaultdict, deque
+from collections.abc import Iterable, Mapping
 from enum import Enum
 from functools import partial
-
-from cls_cad_backend.database.commands import get_all_parts_for_project
+from weakref import WeakValueDictionary
+
+from cls_cad_backend.database.commands import (
+    get_all_parts_for_project,
+    get_project_versions,
+)
+from cls_cad_backend.settings import REPOSITORY_CACHE_SIZE
+from cls_cad_backend.util.cache import LRUCache
+from cls_cad_backend.util.frozen import freeze
 from cls_cad_backend.util.motion import combine_motions
-from clsp import Any, Constructor, Omega, Subtypes, Type
+from cls_cad_backend.util.subtypes import Taxonomy
+from clsp import Any, Constructor, Omega, Type
 from clsp.dsl import DSL
 from clsp.types import Literal, LVar
 
 
 class Part:
+    __slots__ = ("info", "_hash")
+    # Interned infos by their hash. Only the infos are referenced weakly (dicts keep
+    # their keys alive), so infos that no part uses anymore are collected.
+    _interned_infos: WeakValueDictionary = WeakValueDictionary()
+
     def __call__(self, *required_parts):
         """
         Collects all arguments that the term gives to a specific application. Then,
@@ -41,30 +53,83 @@ def __call__(self, *required_parts):
 
     def __hash__(self):
         """
-        Necessary for clsp to distinguish Part objects in the repository.
+        Necessary for clsp to distinguish Part objects in the repository. The hash is
+        computed once from the Part JSON when the part is created.
 
         :return: A hash dependent on the Part JSON.
         """
-        return hash(json.dumps(self.info))
+        return self._hash
 
     def __init__(self, info) -> None:
         """
         Parts get created with info from their JSON representation. This is aggregated
-        in the call method.
+        in the call method. The info is frozen and interned, so that all parts with the
+        same info usually share a single instance of it (infos with colliding hashes
+        are not interned).
 
         :param info: A dict containing information about the part.
         """
-        self.info = info
+        frozen_info = freeze(info)
+        info_hash = hash(frozen_info)
+        interned_info = Part._interned_infos.get(info_hash)
+        if interned_info is None:
+            Part._interned_infos[info_hash] = interned_info = frozen_info
+        elif interned_info != frozen_info:
+            interned_info = frozen_info
+        object.__setattr__(self, "info", interned_info)
+        object.__setattr__(self, "_hash", info_hash)
 
     def __eq__(self, other):
         """
         Required for clsp. Computes equality based on if two parts have exactly the
-        same info dict.
+        same info dict. As infos are interned, this is usually an identity check.
 
         :param other: The object to compare against.
         :return: true if the objects are equal, else false.
         """
-        return isinstance(other, Part) and self.__hash__() == other.__hash__()
+        return isinstance(other, Part) and (
+            self.info is other.info
+            or (self._hash == other._hash and self.info == other.info)
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Part is immutable")
+
+    def __reduce__(self):
+        return Part, (self.info,)
+
+
+class PartClass(Part):
+    __slots__ = ("members",)
+
+    def __init__(self, members: list[Part]) -> None:
+        """
+        A class of parts that have exactly the same type, e.g. identical screws from
+        different vendors. The class is a single combinator, so clsp enumerates each
+        assembly only once instead of once per combination of equivalent parts. When
+        interpreted, the cheapest (then most available) part of the class is used, the
+        other parts are listed as alternatives.
+
+        :param members: The equivalent parts.
+        """
+        members = sorted(
+            members,
+            key=lambda member: (
+                member.info["cost"],
+                -member.info["availability"],
+                member.info["forgeDocumentId"],
+            ),
+        )
+        object.__setattr__(self, "members", tuple(members))
+        super().__init__(
+            dict(
+                members[0].info,
+                alternatives=[member.info["forgeDocumentId"] for member in members[1:]],
+            )
+        )
+
+    def __reduce__(self):
+        return PartClass, (list(self.members),)
 
 
 class Role(str, Enum):
@@ -72,7 +137,7 @@ class Role(str, Enum):
     provides = "provides"
 
 
-def generate_leaf(provides: list[Constructor], part_counts, taxonomy) -> Type:
+def generate_leaf(provides: list[Constructor], part_counts, taxonomy: Taxonomy) -> Type:
     """
     Generates a leaf type, i.e., the type of a part that only provides something and
     doesn't require anything. Such a part binds either a part count of 0 or 1 of a
@@ -87,11 +152,7 @@ def generate_leaf(provides: list[Constructor], part_counts, taxonomy) -> Type:
     """
     arguments = [
         Literal(1, count_name)
-        if taxonomy.check_subtype(
-            Type.intersect(provides),
-            Type.intersect([Constructor(type_name) for type_name in count_types]),
-            dict(),
-        )
+        if taxonomy.satisfies([typ.name for typ in provides], count_types)
         else Literal(0, count_name)
         for count_types, _, count_name in part_counts
     ]
@@ -230,14 +291,151 @@ def types_from_uuids(
     )
 
 
+def configuration_signature(part: dict, configuration: dict) -> tuple:
+    """
+    Computes everything the type and the interpretation of a part configuration depend
+    on, ignoring the uuids and metadata of the part. Configurations with the same
+    signature are interchangeable in every assembly.
+
+    :param part: The part JSON.
+    :param configuration: The configuration of the part.
+    :return: A hashable signature.
+    """
+    provides = part["jointOrigins"][configuration["providesJointOrigin"]]
+    return (
+        tuple(
+            (
+                tuple(sorted(part["jointOrigins"][uuid]["requires"])),
+                part["jointOrigins"][uuid]["count"],
+                part["jointOrigins"][uuid]["motion"],
+            )
+            for uuid in configuration["requiresJointOrigins"]
+        ),
+        (tuple(sorted(provides["provides"])), provides["count"], provides["motion"]),
+    )
+
+
+def normalize_part_counts(
+    part_counts: list[tuple[str, int, str]] | None
+) -> tuple[tuple[tuple[str, ...], str], ...]:
+    """
+    Reduces the constraints of a synthesis request to the parts that influence the
+    repository. The types in the repository only depend on the counted types and the
+    names of the constraints, not on the requested numbers.
+
+    :param part_counts: The constraints of the synthesis request.
+    :return: A hashable representation of the constraints.
+    """
+    if not part_counts:
+        return ()
+    return tuple(
+        (tuple(sorted(count_types)), count_name)
+        for count_types, _, count_name in part_counts
+    )
+
+
+def relevant_parts(
+    parts: Iterable[dict], target: list[str], taxonomy: Taxonomy
+) -> list[dict]:
+    """
+    Removes the part configurations that cannot be used in any assembly for a target.
+    A configuration is usable if each of its required JointOrigins can be connected to
+    a usable configuration (so configurations requiring nothing are usable), and it is
+    relevant if it provides the target or a type required by a relevant configuration.
+    Counting constraints are ignored, so this never removes a configuration that is
+    used in some result.
+
+    :param parts: The part JSONs.
+    :param target: The requested types (their intersection is requested).
+    :param taxonomy: The taxonomy describing the subtype relationships.
+    :return: The parts with only their relevant configurations. Parts without any are
+        left out.
+    """
+    satisfies = taxonomy.satisfies
+    parts = list(parts)
+    configurations = [
+        (
+            part_index,
+            configuration_index,
+            frozenset(
+                part["jointOrigins"][configuration["providesJointOrigin"]]["provides"]
+            ),
+            {
+                frozenset(part["jointOrigins"][uuid]["requires"])
+                for uuid in configuration["requiresJointOrigins"]
+            },
+        )
+        for part_index, part in enumerate(parts)
+        for configuration_index, configuration in enumerate(part["configurations"])
+    ]
+    required_types = {r for _, _, _, required in configurations for r in required}
+    providers = {
+        r: [
+            i
+            for i, (_, _, provided, _) in enumerate(configurations)
+            if satisfies(provided, r)
+        ]
+        for r in required_types
+    }
+    provides_for = defaultdict(list)
+    dependents = defaultdict(list)
+    for r in required_types:
+        for i in providers[r]:
+            provides_for[i].append(r)
+    for i, (_, _, _, required) in enumerate(configurations):
+        for r in required:
+            dependents[r].append(i)
+
+    # Usable configurations, starting from those that require nothing.
+    missing = [len(required) for _, _, _, required in configurations]
+    usable = [count == 0 for count in missing]
+    satisfied: set[frozenset[str]] = set()
+    to_visit = deque(i for i, is_usable in enumerate(usable) if is_usable)
+    while to_visit:
+        for r in provides_for[to_visit.popleft()]:
+            if r in satisfied:
+                continue
+            satisfied.add(r)
+            for i in dependents[r]:
+                missing[i] -= 1
+                if missing[i] == 0:
+                    usable[i] = True
+                    to_visit.append(i)
+
+    # Relevant configurations, starting from those providing the target.
+    target_type = frozenset(target)
+    relevant = {
+        i
+        for i, (_, _, provided, _) in enumerate(configurations)
+        if usable[i] and satisfies(provided, target_type)
+    }
+    to_visit = deque(relevant)
+    while to_visit:
+        for r in configurations[to_visit.popleft()][3]:
+            for i in providers[r]:
+                if usable[i] and i not in relevant:
+                    relevant.add(i)
+                    to_visit.append(i)
+
+    kept = defaultdict(list)
+    for i in sorted(relevant):
+        part_index, configuration_index, _, _ = configurations[i]
+        kept[part_index].append(
+            parts[part_index]["configurations"][configuration_index]
+        )
+    return [dict(parts[i], configurations=kept[i]) for i in sorted(kept)]
+
+
 class RepositoryBuilder:
+    cache: LRUCache = LRUCache(REPOSITORY_CACHE_SIZE)
+
     @staticmethod
     def add_part_to_repository(
         part: dict,
         repository: dict,
         *,
         part_counts: list[tuple[str, int, str]] | None = None,
-        taxonomy: Subtypes = None,
+        taxonomy: Taxonomy = None,
     ) -> None:
         """
         Adds a part to a repository to be used for synthesis. The type is dependent on
@@ -272,7 +470,9 @@ def add_part_to_repository(
                     taxonomy,
                 )
             elif len(types_by_uuid) > 1 and part_counts:
-                provides_type = Type.intersect(next(reversed(types_by_uuid.values())))
+                provided = next(reversed(types_by_uuid.values()))
+                provides_type = Type.intersect(provided)
+                provided_names = [typ.name for typ in provided]
 
                 # We collect the count variables for each position, so that we can
                 # annotate the constructor afterwards.
@@ -285,13 +485,7 @@ def add_part_to_repository(
                         counted_types[uuid].append(LVar(f"{uuid}_{count_name}"))
                         multiplicities[uuid] = part["jointOrigins"][uuid]["count"]
 
-                    if taxonomy.check_subtype(
-                        provides_type,
-                        Type.intersect(
-                            [Constructor(type_name) for type_name in count_types]
-                        ),
-                        dict(),
-                    ):
+                    if taxonomy.satisfies(provided_names, count_types):
                         part_type = part_type.AsRaw(
                             partial(
                                 collect_and_increment_part_count,
@@ -337,7 +531,9 @@ def add_part_to_repository(
                         f"{uuid}",
                         Type.intersect(joint_types),
                     )
-                provides_type = Type.intersect(next(reversed(types_by_uuid.values())))
+                provided = next(reversed(types_by_uuid.values()))
+                provides_type = Type.intersect(provided)
+                provided_names = [typ.name for typ in provided]
 
             part_type = part_type.In(provides_type)
 
@@ -359,9 +555,10 @@ def add_part_to_repository(
     @staticmethod
     def add_all_to_repository(
         project_id: str,
-        taxonomy: Subtypes,
+        taxonomy: Taxonomy,
         *,
         part_counts: list[tuple[str, int, str]] | None = None,
+        target: list[str] | None = None,
     ):
         """
         Add all parts found in the database from a specific project into the repository.
@@ -370,15 +567,101 @@ def add_all_to_repository(
         :param taxonomy: The taxonomy describing the subtype relationships.
         :param part_counts: The constraints for the synthesis request (the types in the
             repository depend on this).
+        :param target: If given, only the part configurations relevant to this target
+            are added, see relevant_parts.
         :return: The repository containing all part combinators with their respective
             types.
         """
+        parts = get_all_parts_for_project(project_id)
+        if target is not None:
+            parts = relevant_parts(parts, target, taxonomy)
+        return RepositoryBuilder.add_parts_to_repository(
+            parts,
+            taxonomy,
+            part_counts=part_counts,
+        )
+
+    @staticmethod
+    def add_parts_to_repository(
+        parts: Iterable[dict],
+        taxonomy: Taxonomy,
+        *,
+        part_counts: list[tuple[str, int, str]] | None = None,
+    ):
+        """
+        Add all given part JSONs into a new repository. Part configurations with the same
+        signature are grouped into a single PartClass combinator.
+
+        :param parts: The part JSONs to add.
+        :param taxonomy: The taxonomy describing the subtype relationships.
+        :param part_counts: The constraints for the synthesis request (the types in the
+            repository depend on this).
+        :return: The repository containing all part combinators with their respective
+            types.
+        """
+        classes: defaultdict[tuple, dict] = defaultdict(dict)
+        for part in parts:
+            for configuration in part["configurations"]:
+                RepositoryBuilder.add_part_to_repository(
+                    dict(part, configurations=[configuration]),
+                    classes[configuration_signature(part, configuration)],
+                    part_counts=part_counts,
+                    taxonomy=taxonomy,
+                )
+
         repository: dict = {}
-        for part in get_all_parts_for_project(project_id):
-            RepositoryBuilder.add_part_to_repository(
-                part,
-                repository,
-                part_counts=part_counts,
-                taxonomy=taxonomy,
-            )
+        for members in classes.values():
+            if len(members) == 1:
+                repository.update(members)
+                continue
+            part_class = PartClass(list(members))
+            repository[part_class] = members[part_class.members[0]]
         return repository
+
+    @staticmethod
+    def cached_repository(
+        project_id: str,
+        taxonomy: Taxonomy,
+        *,
+        part_counts: list[tuple[str, int, str]] | None = None,
+        target: list[str] | None = None,
+    ):
+        """
+        Like add_all_to_repository, but reuses a previously built repository if neither
+        the parts nor the taxonomy of the project changed since. Repositories are keyed
+        by the content versions of the project, the normalized constraints and the
+        target.
+
+        :param project_id: The id of the project to get parts from.
+        :param taxonomy: The taxonomy describing the subtype relationships. It has to
+            be the current taxonomy of the project.
+        :param part_counts: The constraints for the synthesis request (the types in the
+            repository depend on this).
+        :param target: If given, only the part configurations relevant to this target
+            are added, see relevant_parts.
+        :return: The repository containing all part combinators with their respective
+            types.
+        """
+        key = (
+            project_id,
+            *get_project_versions(project_id),
+            normalize_part_counts(part_counts),
+            None if target is None else tuple(sorted(set(target))),
+        )
+        return RepositoryBuilder.cache.get_or_compute(
+            key,
+            lambda: RepositoryBuilder.add_all_to_repository(
+                project_id, taxonomy, part_counts=part_counts, target=target
+            ),
+        )
+
+    @staticmethod
+    def invalidate_cache(project_id: str) -> None:
+        """
+        Drops all cached repositories of a project. Changed projects are never served
+        stale repositories, as their version changes, but this frees the memory early.
+
+        :param project_id: The id of the project whose repositories should be dropped.
+        :return:
+        """
+        RepositoryBuilder.cache.invalidate(lambda key: key[0] == project_id)
@@ -1,14 +1,37 @@
+import gzip
 import json
 import typing
+import zlib
 
+from cls_cad_backend.settings import COMPRESSION_MIN_SIZE
+from cls_cad_backend.util.cache import LRUCache
+from cls_cad_backend.util.json_encoding import json_bytes
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
 from starlette.responses import Response
 
-base_json = True
+# Compressions and binary formats, by preference. Brotli, MessagePack and CBOR are only
+# offered if the corresponding package is installed.
+compressors: dict[str, typing.Callable[[bytes], bytes]] = {}
+binary_encoders: dict[str, typing.Callable[[typing.Any], bytes]] = {}
 try:  # pragma: no cover
-    import orjson
-    import ujson
+    import brotli
 
-    base_json = False
+    compressors["br"] = lambda body: brotli.compress(body, quality=5)
+except ImportError:  # pragma: no cover
+    pass
+compressors["gzip"] = lambda body: gzip.compress(body, compresslevel=6)
+try:  # pragma: no cover
+    import msgpack
+
+    binary_encoders["application/msgpack"] = msgpack.packb
+    binary_encoders["application/x-msgpack"] = msgpack.packb
+except ImportError:  # pragma: no cover
+    pass
+try:  # pragma: no cover
+    import cbor2
+
+    binary_encoders["application/cbor"] = cbor2.dumps
 except ImportError:  # pragma: no cover
     pass
 
@@ -24,14 +47,160 @@ def render(self, content: typing.Any) -> bytes:
         :param content: The content to encode.
         :return: The encoded content.
         """
-        if base_json:  # pragma: no cover
-            return json.dumps(content, indent=2, ensure_ascii=False).encode("utf-8")
-        try:  # pragma: no cover
-            return orjson.dumps(content, option=orjson.OPT_INDENT_2)
-        except TypeError:  # pragma: no cover
-            try:
-                return ujson.dumps(content, indent=2, ensure_ascii=False).encode(
-                    "utf-8"
-                )
-            except OverflowError:
-                return json.dumps(content, indent=2, ensure_ascii=False).encode("utf-8")
+        return json_bytes(content)
+
+
+def accepted(header: str) -> list[str]:
+    """
+    Parses an Accept or Accept-Encoding header into the accepted values, in the order
+    of the header. Values with a quality of 0 are not accepted.
+
+    :param header: The header value.
+    :return: The accepted values, in lower case and without parameters.
+    """
+    values = []
+    for item in header.lower().split(","):
+        value, *parameters = [part.strip() for part in item.split(";")]
+        if value and not any(
+            parameter.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+            for parameter in parameters
+        ):
+            values.append(value)
+    return values
+
+
+def negotiate_media_type(accept: str) -> str:
+    """
+    Chooses the format of a response. JSON is used unless the client explicitly accepts
+    MessagePack (requires msgpack) or CBOR (requires cbor2).
+
+    :param accept: The Accept header of the request.
+    :return: The media type of the response.
+    """
+    for media_type in accepted(accept):
+        if media_type in binary_encoders:
+            return media_type
+    return "application/json"
+
+
+def negotiate_encoding(accept_encoding: str) -> str | None:
+    """
+    Chooses the compression of a response, preferring brotli (requires brotli) over
+    gzip.
+
+    :param accept_encoding: The Accept-Encoding header of the request.
+    :return: The content encoding, or None if the response is not compressed.
+    """
+    encodings = accepted(accept_encoding)
+    for encoding in compressors:
+        if encoding in encodings:
+            return encoding
+    return None
+
+
+def encode_body(
+    content: typing.Any,
+    encoded: bytes | None,
+    media_type: str,
+    encoding: str | None,
+    pretty: bool,
+) -> tuple[bytes, str | None]:
+    """
+    Encodes and compresses the body of a response. Bodies smaller than
+    COMPRESSION_MIN_SIZE are not compressed.
+
+    :param content: The content, if it is not encoded yet.
+    :param encoded: The content encoded as compact JSON, if available.
+    :param media_type: The media type of the response.
+    :param encoding: The content encoding of the response, or None.
+    :param pretty: Whether to indent JSON.
+    :return: A tuple of the body and its content encoding.
+    """
+    if media_type != "application/json":
+        if encoded is not None:
+            content = json.loads(encoded)
+        body = binary_encoders[media_type](content)
+    elif encoded is None or pretty:
+        body = json_bytes(
+            json.loads(encoded) if content is None else content, pretty=pretty
+        )
+    else:
+        body = encoded
+    if encoding is None or len(body) < COMPRESSION_MIN_SIZE:
+        return body, None
+    return compressors[encoding](body), encoding
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Checks whether an If-None-Match header matches an ETag.
+
+    :param if_none_match: The If-None-Match header of the request.
+    :param etag: The quoted ETag of the current representation.
+    :return: True if the client already has the current representation.
+    """
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+async def negotiated_response(
+    request: Request,
+    content: typing.Any = None,
+    *,
+    encoded: bytes | typing.Callable[[], bytes] | None = None,
+    pretty: bool = True,
+    cache: LRUCache | None = None,
+    cache_key: typing.Hashable | None = None,
+    etag: str | None = None,
+    cache_control: str | None = None,
+) -> Response:
+    """
+    Creates a response in the format (JSON, MessagePack or CBOR) and with the
+    compression (brotli, gzip or none) the client accepts. Encoding and compressing run
+    in a worker thread. For content that never changes, the compressed or binary body
+    can be cached. The cache key is extended by format, compression and pretty.
+
+    If an etag is given, it is extended the same way to identify the representation,
+    and a request with a matching If-None-Match header is answered with 304 Not Modified
+    without creating the content.
+
+    :param request: The request to respond to.
+    :param content: The content of the response. Can also be a function returning it,
+        which is only called if the body is needed.
+    :param encoded: The content already encoded as compact JSON, instead of content.
+        Can also be a function returning it, which is only called if the body is needed.
+    :param pretty: Whether to indent JSON.
+    :param cache: A cache for bodies, or None.
+    :param cache_key: The key identifying the content in the cache.
+    :param etag: An unquoted tag that changes whenever the content changes, or None.
+    :param cache_control: The Cache-Control header of the response, or None.
+    :return: The response.
+    """
+    media_type = negotiate_media_type(request.headers.get("accept", ""))
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", ""))
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if cache_control:
+        headers["Cache-Control"] = cache_control
+    if etag:
+        representation = f"{media_type}:{encoding}:{pretty}"
+        headers["ETag"] = f'"{etag}-{zlib.crc32(representation.encode()):08x}"'
+        if etag_matches(request.headers.get("if-none-match", ""), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+    key = (cache_key, media_type, encoding, pretty)
+    cacheable = cache is not None and (encoding or media_type != "application/json")
+    cached = cache.get(key) if cacheable else None
+    if cached is None:
+        if callable(encoded):
+            encoded = encoded()
+        if callable(content):
+            content = content()
+        cached = await run_in_threadpool(
+            encode_body, content, encoded, media_type, encoding, pretty
+        )
+        if cacheable:
+            cache.put(key, cached)
+    body, encoding = cached
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=media_type, headers=headers)
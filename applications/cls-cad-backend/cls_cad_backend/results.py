@@ -0,0 +1,191 @@
+from itertools import chain
+
+from cls_cad_backend.database.commands import (
+    get_all_summaries_for_project,
+    get_result_chunks,
+    get_result_for_id_in_project,
+    get_result_header_for_id_in_project,
+    get_summary_for_fingerprint,
+    get_summary_for_id_in_project,
+    get_unsummarized_results_for_project,
+    mark_results_summarized,
+    results_summarized,
+    upsert_result,
+    upsert_summary,
+)
+from cls_cad_backend.settings import (
+    RESPONSE_CACHE_BYTES,
+    RESPONSE_CACHE_SIZE,
+    RESULT_CACHE_BYTES,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL_SECONDS,
+)
+from cls_cad_backend.util.cache import LRUCache
+from cls_cad_backend.util.json_operations import summarize_assemblies
+
+# The chunks of assemblies of recently retrieved synthesis results, keyed on (result
+# id, project id, chunk index), each assembly encoded once as compact JSON. Since these
+# can be several Mb of JSON data, the cache is limited by their total size.
+result_cache = LRUCache(
+    RESULT_CACHE_SIZE,
+    ttl=RESULT_CACHE_TTL_SECONDS,
+    max_bytes=RESULT_CACHE_BYTES,
+    size_of=lambda fragments: sum(len(fragment) for fragment in fragments),
+)
+
+# Compressed or binary responses for ranges of assemblies of synthesis results, keyed
+# on ((result id, project id, start, stop), media type, content encoding, pretty), see
+# negotiated_response.
+response_cache = LRUCache(
+    RESPONSE_CACHE_SIZE,
+    ttl=RESULT_CACHE_TTL_SECONDS,
+    max_bytes=RESPONSE_CACHE_BYTES,
+    size_of=lambda response: len(response[0]),
+)
+
+# The metadata of recently retrieved synthesis results, keyed on (result id, project id).
+header_cache = LRUCache(RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL_SECONDS)
+
+
+def result_header(request_id: str, project_id: str) -> dict | None:
+    """
+    Retrieves the metadata of a synthesis result, from the cache if possible.
+
+    :param request_id: The id of the result.
+    :param project_id: The id of the project of the result.
+    :return: The JSON of the result without its assemblies, containing count and
+        chunkSize fields. None if the result does not exist.
+    """
+    header = header_cache.get((request_id, project_id))
+    if header is None:
+        header = get_result_header_for_id_in_project(request_id, project_id)
+        if header is not None:
+            header_cache.put((request_id, project_id), header)
+    return header
+
+
+def content_hash(header: dict) -> str:
+    """
+    Identifies the assemblies of a synthesis result, for use in ETags.
+
+    :param header: The metadata of the result, see result_header.
+    :return: The hash of the assemblies, or the result id and timestamp for results
+        stored before hashes were recorded (results are never modified).
+    """
+    return header.get("contentHash") or f"{header['_id']}-{header.get('timestamp')}"
+
+
+def cached_assembly_bytes(header: dict, start: int, stop: int) -> list[bytes]:
+    """
+    Retrieves a range of assemblies of a synthesis result as compact JSON, one encoded
+    value per assembly. Only the chunks containing the range are read from the database
+    (if they are not cached yet), and each assembly is encoded only once.
+
+    :param header: The metadata of the result, see result_header.
+    :param start: The index of the first assembly.
+    :param stop: The index after the last assembly.
+    :return: The encoded post-processed assemblies in the range.
+    """
+    result_id, project_id = header["_id"], header["forgeProjectId"]
+    chunk_size = header["chunkSize"]
+    start, stop = max(start, 0), min(stop, header["count"])
+    if start >= stop:
+        return []
+    indices = range(start // chunk_size, (stop - 1) // chunk_size + 1)
+    chunks = {
+        index: result_cache.get((result_id, project_id, index)) for index in indices
+    }
+    missing = [index for index, chunk in chunks.items() if chunk is None]
+    if missing:
+        for index, fragments in get_result_chunks(
+            result_id, project_id, missing, encoded=True
+        ).items():
+            chunks[index] = fragments
+            result_cache.put((result_id, project_id, index), fragments)
+    offset = indices.start * chunk_size
+    fragments = list(chain.from_iterable(chunks[index] or [] for index in indices))
+    return fragments[start - offset : stop - offset]
+
+
+def store_result(result: dict) -> None:
+    """
+    Inserts a result and its summary into the database and removes an older result
+    with the same id from the cache.
+
+    :param result: The JSON of the result, containing an _id field.
+    :return:
+    """
+    upsert_result(result)
+    upsert_summary(result_summary(result))
+    header_cache.invalidate(lambda key: key[0] == result["_id"])
+    result_cache.invalidate(lambda key: key[0] == result["_id"])
+    response_cache.invalidate(lambda key: key[0][0] == result["_id"])
+
+
+def result_summary(result: dict) -> dict:
+    """
+    Creates the summary of a result. It contains all metadata of the result and the
+    aggregates of its assemblies, so that listing results and computing maximum part
+    counts never has to load the assemblies.
+
+    :param result: The JSON of the result.
+    :return: The JSON of the summary, with the same _id as the result.
+    """
+    summary = {key: value for key, value in result.items() if key != "interpretedTerms"}
+    summary.update(summarize_assemblies(result["interpretedTerms"]))
+    return summary
+
+
+def memoized_result(project_id: str, fingerprint: str) -> dict | None:
+    """
+    Looks up an earlier result of a synthesis request with the same fingerprint, see
+    request_fingerprint.
+
+    :param project_id: The id of the project of the synthesis request.
+    :param fingerprint: The fingerprint of the synthesis request.
+    :return: The metadata of the newest such result, with "reused" set to True, or None
+        if there is none.
+    """
+    summary = get_summary_for_fingerprint(project_id, fingerprint)
+    if summary is None:
+        return None
+    metadata = {
+        key: value
+        for key, value in summary.items()
+        if key not in summarize_assemblies([]) and key != "payload"
+    }
+    return dict(metadata, reused=True)
+
+
+def summary_for_id(request_id: str, project_id: str) -> dict | None:
+    """
+    Retrieves the summary of a result. Results stored before summaries existed are
+    summarized (and the summary stored) on first access.
+
+    :param request_id: The id of the result.
+    :param project_id: The id of the project of the result.
+    :return: The JSON of the summary, or None if the result does not exist.
+    """
+    summary = get_summary_for_id_in_project(request_id, project_id)
+    if summary is None:
+        result = get_result_for_id_in_project(request_id, project_id)
+        if result is None:
+            return None
+        summary = result_summary(result)
+        upsert_summary(summary)
+    return summary
+
+
+def summaries_for_project(project_id: str) -> list[dict]:
+    """
+    Retrieves the summaries of all results of a project, newest first. Results stored
+    before summaries existed are summarized the first time a project is listed.
+
+    :param project_id: The id of the project.
+    :return: The list of summary JSONs.
+    """
+    if not results_summarized(project_id):
+        for result in get_unsummarized_results_for_project(project_id):
+            upsert_summary(result_summary(result))
+        mark_results_summarized(project_id)
+    return list(get_all_summaries_for_project(project_id))
@@ -52,3 +52,5 @@ class SynthesisRequestInf(BaseModel, frozen=True):
     tag: str | None = None
     partCounts: list[CountNumOfPartTypeInf] | None = None
     sourceUuid: str | None = None
+    pageSize: int = Field(100, gt=0)
+    rankBy: Literal["cost", "availability"] | None = None
@@ -1,40 +1,78 @@
+import asyncio
+import json
 import mimetypes
 import os
 import sys
-from collections import defaultdict
-from datetime import datetime
-from timeit import default_timer as timer
+from typing import Literal
 
 from cls_cad_backend.database.commands import (
     get_all_projects_in_results,
-    get_all_result_ids_for_project,
-    get_result_for_id_in_project,
+    get_indexed_types,
+    get_joint_origins_for_types,
+    get_project_versions,
     get_taxonomy_for_project,
+    index_report,
+    init_database,
+    migrate_results_to_chunks,
     upsert_part,
-    upsert_result,
-    upsert_taxonomy, init_database,
+    upsert_taxonomy,
+)
+from cls_cad_backend.feasibility import (
+    project_provided_types,
+    unsatisfiable_constraints,
+)
+from cls_cad_backend.jobs import cancel_job, get_job, shutdown_pool, submit_job
+from cls_cad_backend.repository_builder import RepositoryBuilder
+from cls_cad_backend.responses import FastResponse, negotiated_response
+from cls_cad_backend.results import (
+    cached_assembly_bytes,
+    content_hash,
+    memoized_result,
+    response_cache,
+    result_cache,
+    result_header,
+    store_result,
+    summaries_for_project,
+    summary_for_id,
 )
-from cls_cad_backend.repository_builder import RepositoryBuilder, wrapped_counted_types
-from cls_cad_backend.responses import FastResponse
 from cls_cad_backend.schemas import PartInf, SynthesisRequestInf, TaxonomyInf
-from cls_cad_backend.util.hrid import generate_id
-from cls_cad_backend.util.json_operations import (
-    invert_taxonomy,
-    postprocess,
-    suffix_and_merge_taxonomy,
+from cls_cad_backend.settings import (
+    ADMIN_ENABLED,
+    INVERTED_TAXONOMY_CACHE_SIZE,
+    MERGED_TAXONOMY_CACHE_SIZE,
+    PROFILING_ENABLED,
 )
-from clsp import (
-    Constructor,
-    FiniteCombinatoryLogic,
-    Subtypes,
-    Type,
-    enumerate_terms,
-    interpret_term,
+from cls_cad_backend.synthesis import (
+    EnumerationCursor,
+    cursors,
+    inhabit,
+    iterate_synthesis,
+    load_taxonomy,
+    part_counts_of,
+    request_fingerprint,
+    result_document,
+    result_metadata,
+    shutdown_postprocess_pool,
+    synthesize,
+)
+from cls_cad_backend.util.cache import LRUCache
+from cls_cad_backend.util.hrid import generate_id
+from cls_cad_backend.util.json_encoding import json_array_bytes, json_bytes
+from cls_cad_backend.util.json_operations import invert_taxonomy
+from cls_cad_backend.util.metrics import (
+    publish,
+    render,
+    synthesis_requests,
+    timed,
+    traced,
 )
-from clsp.types import Literal, Omega
-from fastapi import FastAPI
+from cls_cad_backend.util.profiling import profile_call, saved_artifact
+from cls_cad_backend.util.subtypes import Taxonomy
+from fastapi import FastAPI, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.background import BackgroundTasks
+from starlette.background import BackgroundTask, BackgroundTasks
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import FileResponse, PlainTextResponse, StreamingResponse
 from starlette.staticfiles import StaticFiles
 
 init_database()
@@ -62,7 +100,30 @@
     StaticFiles(directory=os.path.join(os.path.dirname(__file__), "static"), html=True),
     name="static",
 )
-cache = {}
+
+# Stored synthesis results never change, so clients may cache them indefinitely.
+immutable_cache_control = "public, max-age=31536000, immutable"
+
+# Inverted taxonomies, keyed on (project id, taxonomy version).
+inverted_taxonomies = LRUCache(INVERTED_TAXONOMY_CACHE_SIZE)
+
+# Merged taxonomies with their subtype closure, keyed on (project id, taxonomy version).
+loaded_taxonomies = LRUCache(MERGED_TAXONOMY_CACHE_SIZE)
+
+# Synchronous synthesis requests that are being computed (or whose result is not
+# stored yet), keyed on their fingerprint, see request_fingerprint.
+in_flight: dict[str, asyncio.Future] = {}
+
+
+@app.on_event("shutdown")
+def stop_workers():
+    """
+    Stops the worker processes of asynchronous synthesis jobs and post-processing.
+
+    :return:
+    """
+    shutdown_pool()
+    shutdown_postprocess_pool()
 
 
 @app.post("/submit/part")
@@ -79,6 +140,7 @@ async def save_part(
         didn't pass validation.
     """
     upsert_part(payload.model_dump(by_alias=True))
+    RepositoryBuilder.invalidate_cache(payload.meta.forgeProjectId)
     print(payload.model_dump(by_alias=True))
     return "OK"
 
@@ -97,101 +159,479 @@ async def save_taxonomy(
         didn't pass validation.
     """
     upsert_taxonomy(payload.model_dump(by_alias=True))
+    RepositoryBuilder.invalidate_cache(payload.id)
     return "OK"
 
 
 @app.post("/request/assembly")
 async def synthesize_assembly(
-    payload: SynthesisRequestInf, background_tasks: BackgroundTasks
+    payload: SynthesisRequestInf,
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    run_async: bool = Query(False, alias="async"),
+    force: bool = False,
+    profile: bool = False,
+    profile_memory: bool = Query(False, alias="profileMemory"),
 ):
     """
-    Takes a payload describing a synthesis request as JSON. Builds a repository and a
-    query and then executes clsp. Results (if present) get enumerated (up to 100) and
-    then post-processed into assembly instructions for the Fusion 360 Add-In to execute.
-    A background task inserts the results bundled in a single JSON Object into the
-    database.
+    Takes a payload describing a synthesis request as JSON. Builds a repository (or
+    reuses a cached one if the project did not change) and a query and then executes
+    clsp. Results (if present) get enumerated (up to pageSize) and then post-processed
+    into assembly instructions for the Fusion 360 Add-In to execute. A background task
+    inserts the results bundled in a single JSON Object into the database. If there may
+    be more results, the response contains a cursor for /request/assembly/next.
+
+    If rankBy is set, the pageSize cheapest (or most available) assemblies are
+    enumerated instead, best first, by a best-first search over the tree grammar (see
+    ranked_terms). Ranked requests return no cursor.
+
+    If the same request (see request_fingerprint) was already answered for the current
+    parts and taxonomy of the project, the metadata of that result is returned instead,
+    with "reused" set to True and without a cursor. Use force=1 to synthesize anyway.
+    If the same request is being synthesized right now, the request waits for it and
+    returns the metadata of its result, with "coalesced" set to True and without a
+    cursor. If that request is cancelled, a waiting request synthesizes instead.
+
+    With async=1, the request is instead queued for execution in a worker process and a
+    job id is returned immediately, see /jobs/{job_id}.
+
+    The time spent in each phase is logged with the request id (taken from the
+    X-Request-ID header if present, and returned in it) and exposed on /metrics.
+
+    Requests that cannot have results (see /request/assembly/feasibility) fail
+    immediately, the reasons are returned as JSON in the X-Infeasible header.
+
+    If profiling is enabled in the settings (CLS_CAD_PROFILING), profile=1 synthesizes
+    under cProfile (and with profileMemory=1 also tracemalloc), without reusing or
+    coalescing with other requests. The response then contains a profileId (also in the
+    X-Profile-ID header, even if there are no results), see /admin/profiles/{profile_id}.
+    Profiled requests post-process all results in the profiled thread instead of the
+    worker pool, so that the profile covers them.
 
     :param payload: The payload containing target types and constraints for the
         synthesis request.
+    :param request: The request, for its X-Request-ID header.
+    :param response: The response, to return the request id in its X-Request-ID header.
     :param background_tasks: The background tasks to asynchronously insert into the
         database.
-    :return: A JSON containing a result id and metadata, or FAIL if there are no
-        results.
-    """
-    take_time = timer()
-    literals = {}
-    part_count_type = Omega()
-    if payload.partCounts:
-        for partCount in payload.partCounts:
-            literals[partCount.partCountName] = list(range(partCount.partNumber + 1))
-        part_count_type = wrapped_counted_types(
-            [Literal(c.partNumber, c.partCountName) for c in payload.partCounts]
+    :param run_async: Whether to execute the request as an asynchronous job.
+    :param force: Whether to synthesize even if an earlier result can be reused.
+    :param profile: Whether to profile the synthesis.
+    :param profile_memory: Whether to also trace memory allocations when profiling.
+    :return: A JSON containing a result id and metadata (and a cursor), or FAIL if
+        there are no results. For asynchronous requests, a JSON containing the job id
+        and status. Invalid if profiling was requested but is not enabled.
+    """
+    request_id = request.headers.get("X-Request-ID") or generate_id()
+    response.headers["X-Request-ID"] = request_id
+    reasons = await run_in_threadpool(unsatisfiable, payload)
+    if reasons:
+        response.headers["X-Infeasible"] = json.dumps(reasons)
+        synthesis_requests.inc(outcome="infeasible")
+        return "FAIL"
+    fingerprint = request_fingerprint(
+        payload, get_project_versions(payload.forgeProjectId)
+    )
+    if profile:
+        if not PROFILING_ENABLED or run_async:
+            return "Invalid"
+        profile_id = generate_id()
+        response.headers["X-Profile-ID"] = profile_id
+        result, cursor = await run_in_threadpool(
+            profile_call,
+            profile_id,
+            profile_memory,
+            run_synthesis,
+            payload,
+            fingerprint,
+            request_id,
+            parallel=False,
+        )
+        if result is None:
+            return "FAIL"
+        background_tasks.add_task(store_result, result)
+        metadata = dict(result_metadata(result), profileId=profile_id)
+        return metadata if cursor is None else with_cursor(metadata, cursor)
+    if run_async:
+        job_id = await run_in_threadpool(submit_job, payload, fingerprint=fingerprint)
+        return get_job(job_id)
+    if not force:
+        reused = memoized_result(payload.forgeProjectId, fingerprint)
+        if reused is not None:
+            synthesis_requests.inc(outcome="reused")
+            return reused
+
+    while (pending := in_flight.get(fingerprint)) is not None:
+        try:
+            metadata = await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            # If the request that synthesizes was cancelled (e.g., its client went
+            # away), synthesize here instead (or wait for whoever does).
+            if not pending.cancelled():
+                raise
+            continue
+        synthesis_requests.inc(outcome="coalesced")
+        return metadata if metadata == "FAIL" else dict(metadata, coalesced=True)
+
+    pending = asyncio.get_running_loop().create_future()
+    pending.add_done_callback(lambda future: future.cancelled() or future.exception())
+    in_flight[fingerprint] = pending
+    try:
+        result, cursor = await run_in_threadpool(
+            run_synthesis, payload, fingerprint, request_id
         )
+    except BaseException as e:
+        in_flight.pop(fingerprint, None)
+        if isinstance(e, asyncio.CancelledError):
+            pending.cancel()
+        else:
+            pending.set_exception(e)
+        raise
+
+    if result is None:
+        in_flight.pop(fingerprint, None)
+        pending.set_result("FAIL")
+        return "FAIL"
+
+    pending.set_result(result_metadata(result))
+    background_tasks.add_task(store_in_flight_result, result, fingerprint, request_id)
+    if cursor is None:
+        return result_metadata(result)
+    return with_cursor(result_metadata(result), cursor)
+
 
-    query = Type.intersect([Constructor(x, part_count_type) for x in payload.target])
-    taxonomy = Subtypes(
-        suffix_and_merge_taxonomy(get_taxonomy_for_project(payload.forgeProjectId))
+def run_synthesis(
+    payload: SynthesisRequestInf,
+    fingerprint: str,
+    request_id: str,
+    *,
+    parallel: bool = True,
+) -> tuple[dict | None, EnumerationCursor | None]:
+    """
+    Builds a repository (or reuses a cached one), executes clsp and post-processes the
+    first page of results. Runs in a worker thread, see synthesize_assembly.
+
+    :param payload: The synthesis request.
+    :param fingerprint: The fingerprint of the request.
+    :param request_id: The id of the request in the logs.
+    :param parallel: Whether many results may be post-processed in the worker pool.
+    :return: A tuple of the result JSON (None if there are no results) and the cursor to
+        enumerate further results (None for ranked requests).
+    """
+    with traced(request_id) as trace:
+        try:
+            with timed("taxonomy_load"):
+                taxonomy = project_taxonomy(payload.forgeProjectId)
+
+            with timed("repository_build"):
+                repo = RepositoryBuilder.cached_repository(
+                    payload.forgeProjectId,
+                    taxonomy=taxonomy,
+                    part_counts=part_counts_of(payload),
+                    target=payload.target,
+                )
+
+            if payload.rankBy:
+                cursor = None
+                interpreted_terms = synthesize(
+                    payload,
+                    taxonomy,
+                    repo,
+                    max_count=payload.pageSize,
+                    parallel=parallel,
+                )
+            else:
+                cursor = EnumerationCursor(payload, *inhabit(payload, taxonomy, repo))
+                _, interpreted_terms = cursor.next_page(
+                    payload.pageSize, parallel=parallel
+                )
+        except Exception:
+            publish(trace, "synthesis", "error")
+            raise
+        publish(trace, "synthesis", "results" if interpreted_terms else "fail")
+
+    if not interpreted_terms:
+        return None, None
+    result = result_document(
+        generate_id(), payload, interpreted_terms, fingerprint=fingerprint
     )
+    return result, cursor
 
-    repo = RepositoryBuilder.add_all_to_repository(
-        payload.forgeProjectId,
-        taxonomy=taxonomy,
-        part_counts=[
-            (p.partType, p.partNumber, p.partCountName) for p in payload.partCounts
-        ]
-        if payload.partCounts
-        else None,
+
+def store_in_flight_result(result: dict, fingerprint: str, request_id: str) -> None:
+    """
+    Stores the result of a synchronous synthesis request. Until then, identical requests
+    are coalesced with it, afterwards they reuse it from the database.
+
+    :param result: The result JSON.
+    :param fingerprint: The fingerprint of the request.
+    :param request_id: The id of the request in the logs.
+    :return:
+    """
+    try:
+        with traced(request_id) as trace:
+            with timed("persist"):
+                store_result(result)
+            publish(trace, "persist")
+    finally:
+        in_flight.pop(fingerprint, None)
+
+
+@app.post("/request/assembly/feasibility", response_class=FastResponse)
+async def check_feasibility(payload: SynthesisRequestInf):
+    """
+    Statically checks whether a synthesis request can have results, in milliseconds
+    instead of the time a full synthesis takes to fail. Requests are infeasible if no
+    part provides (subtypes of) all targets, or if a counting constraint requires parts
+    of a type that no part provides. Feasible requests may still have no results.
+
+    :param payload: The synthesis request.
+    :return: A JSON containing whether the request is feasible and, if not, the
+        unsatisfiable targets and counting constraints with reasons.
+    """
+    reasons = await run_in_threadpool(unsatisfiable, payload)
+    return {"feasible": not reasons, "unsatisfiable": reasons}
+
+
+def project_taxonomy(project_id: str) -> Taxonomy:
+    """
+    Retrieves the merged taxonomy of a project, see load_taxonomy. It is only merged
+    (and its subtype closure computed) once per taxonomy version.
+
+    :param project_id: The project id.
+    :return: The merged taxonomy.
+    """
+    return loaded_taxonomies.get_or_compute(
+        (project_id, get_project_versions(project_id)[1]),
+        lambda: load_taxonomy(get_taxonomy_for_project(project_id)),
     )
 
-    gamma = FiniteCombinatoryLogic(
-        repo,
-        subtypes=taxonomy,
-        literals=literals,
+
+def unsatisfiable(payload: SynthesisRequestInf) -> list[dict]:
+    """
+    Checks a synthesis request against the provided types and the taxonomy of its
+    project, see unsatisfiable_constraints. Reads from the database, so it runs in a
+    worker thread.
+
+    :param payload: The synthesis request.
+    :return: The unsatisfiable targets and counting constraints, empty if the request
+        may have results.
+    """
+    return unsatisfiable_constraints(
+        payload,
+        project_provided_types(payload.forgeProjectId),
+        project_taxonomy(payload.forgeProjectId),
     )
 
-    result = gamma.inhabit(query)
 
-    terms = []
-    terms.extend(enumerate_terms(query, result, max_count=100))
-    interpreted_terms = [postprocess(interpret_term(term)) for term in terms]
+@app.post("/request/assembly/next/{cursor_id}")
+async def next_assemblies(
+    cursor_id: str,
+    background_tasks: BackgroundTasks,
+    limit: int | None = Query(None, gt=0),
+):
+    """
+    Continues the enumeration of an earlier synthesis request from a cursor, without
+    executing clsp again. The enumerated assemblies are inserted into the database as a
+    new result, like for /request/assembly. Cursors expire some time after their last
+    use. Enumeration runs in a worker thread, concurrent requests for the same cursor
+    get consecutive pages.
+
+    :param cursor_id: The cursor returned by the previous page.
+    :param background_tasks: The background tasks to asynchronously insert into the
+        database.
+    :param limit: How many assemblies to enumerate. Defaults to the pageSize of the
+        synthesis request.
+    :return: A JSON containing a result id and metadata (and a cursor if there may be
+        more results), FAIL if there are no more results, or "Invalid" if the cursor
+        is invalid or expired.
+    """
+    cursor: EnumerationCursor | None = cursors.get(cursor_id)
+    if cursor is None:
+        return "Invalid"
+    offset, interpreted_terms = await run_in_threadpool(
+        cursor.next_page, limit or cursor.payload.pageSize
+    )
 
     if not interpreted_terms:
         return "FAIL"
 
-    request_id = generate_id()
-    background_tasks.add_task(
-        upsert_result,
-        {
-            "_id": request_id,
-            "forgeProjectId": payload.forgeProjectId,
-            "name": payload.name,
-            "timestamp": datetime.today().strftime("%Y-%m-%d %H:%M:%S"),
-            "count": len(interpreted_terms),
-            "interpretedTerms": interpreted_terms,
-            "payload": payload.model_dump(),
-        },
+    result = result_document(
+        generate_id(), cursor.payload, interpreted_terms, offset=offset
     )
-    print(f"Took: {timer() - take_time}")
-    return {
-        "_id": request_id,
-        "forgeProjectId": payload.forgeProjectId,
-        "name": payload.name,
-        "timestamp": datetime.today().strftime("%Y-%m-%d %H:%M:%S"),
-        "count": len(interpreted_terms),
-    }
+    background_tasks.add_task(store_result, result)
+    return with_cursor(result_metadata(result), cursor, cursor_id)
+
+
+def with_cursor(
+    metadata: dict, cursor: EnumerationCursor, cursor_id: str | None = None
+) -> dict:
+    """
+    Keeps a cursor for later pages if its enumeration is not exhausted yet and adds its
+    id to the metadata of a result.
+
+    :param metadata: The metadata of the result of the current page.
+    :param cursor: The cursor the result was enumerated from.
+    :param cursor_id: The id of the cursor, if it was already stored.
+    :return: The metadata, with a "cursor" key if there may be more results.
+    """
+    if cursor.exhausted:
+        cursors.invalidate(lambda key: key == cursor_id)
+        return metadata
+    cursor_id = cursor_id or generate_id()
+    cursors.put(cursor_id, cursor)
+    return dict(metadata, cursor=cursor_id)
+
+
+@app.post("/request/assembly/stream")
+async def stream_assembly(payload: SynthesisRequestInf):
+    """
+    Like /request/assembly, but streams the post-processed assemblies as NDJSON, one
+    line per assembly, as soon as they are enumerated. The first line contains the
+    result id and metadata (without count). If there are no results, a single FAIL line
+    follows. After the stream finished, the results are inserted into the database as
+    a single JSON Object, like for /request/assembly. Streams that did not finish (e.g.,
+    because the client disconnected) are not stored, so that their partial results are
+    never reused.
+
+    :param payload: The payload containing target types and constraints for the
+        synthesis request.
+    :return: A streaming NDJSON response.
+    """
+    fingerprint = request_fingerprint(
+        payload, get_project_versions(payload.forgeProjectId)
+    )
+    result = result_document(generate_id(), payload, [], fingerprint=fingerprint)
+    finished = False
+
+    def lines():
+        nonlocal finished
+        yield json_bytes(result_metadata(result), pretty=False) + b"\n"
+        taxonomy = project_taxonomy(payload.forgeProjectId)
+        repo = RepositoryBuilder.cached_repository(
+            payload.forgeProjectId,
+            taxonomy=taxonomy,
+            part_counts=part_counts_of(payload),
+            target=payload.target,
+        )
+        for interpreted_term in iterate_synthesis(
+            payload, taxonomy, repo, max_count=payload.pageSize
+        ):
+            result["interpretedTerms"].append(interpreted_term)
+            yield json_bytes(interpreted_term, pretty=False) + b"\n"
+        result["count"] = len(result["interpretedTerms"])
+        if not result["interpretedTerms"]:
+            yield json_bytes("FAIL", pretty=False) + b"\n"
+        finished = True
+
+    def persist():
+        if finished and result["interpretedTerms"]:
+            store_result(result)
+
+    return StreamingResponse(
+        lines(), media_type="application/x-ndjson", background=BackgroundTask(persist)
+    )
+
+
+@app.get("/jobs/{job_id}", response_class=FastResponse)
+async def job_status(job_id: str):
+    """
+    Reports the status of an asynchronous synthesis job. The status is one of queued,
+    building, inhabiting, enumerating, persisting, done, failed or cancelled.
+
+    :param job_id: The id of the job.
+    :return: A JSON containing the job id and status. Once the job is done, it also
+        contains the result metadata (or FAIL if there are no results). "Invalid" if
+        the job id was invalid.
+    """
+    return get_job(job_id) or "Invalid"
+
+
+@app.post("/jobs/{job_id}/cancel", response_class=FastResponse)
+async def cancel_job_request(job_id: str):
+    """
+    Cancels an asynchronous synthesis job, if it did not finish yet.
+
+    :param job_id: The id of the job.
+    :return: A JSON containing the job id and status. "Invalid" if the job id was
+        invalid.
+    """
+    return cancel_job(job_id) or "Invalid"
 
 
 @app.get("/data/taxonomy/{project_id}", response_class=FastResponse)
-async def get_taxonomy(project_id: str):
+async def get_taxonomy(project_id: str, request: Request):
     """
     Retrieves the taxonomy and inverts subtype and supertype (Add-In uses Keys as
-    Supertypes, CLS uses Keys as Subtype, for multiple inheritance).
+    Supertypes, CLS uses Keys as Subtype, for multiple inheritance). The response is
+    compressed and encoded as the client accepts, see negotiated_response. Its ETag is
+    the taxonomy version of the project, so clients can revalidate cheaply, and the
+    inverted taxonomy is cached per version.
 
     :param project_id: The project id for which a taxonomy should be retrieved.
+    :param request: The request, to negotiate the response format.
     :return: The inverted taxonomy for the project id if present. If not present, an
         empty default taxonomy.
     """
-    return invert_taxonomy(get_taxonomy_for_project(project_id))
+    _, taxonomy_version = get_project_versions(project_id)
+    return await negotiated_response(
+        request,
+        lambda: inverted_taxonomies.get_or_compute(
+            (project_id, taxonomy_version),
+            lambda: invert_taxonomy(get_taxonomy_for_project(project_id)),
+        ),
+        etag=f"taxonomy-{taxonomy_version}",
+        cache_control="no-cache",
+    )
+
+
+@app.get("/data/types/{project_id}", response_class=FastResponse)
+async def get_type_coverage(project_id: str):
+    """
+    Retrieves which types the parts of a project provide and require, from the type
+    index of the project, e.g. to show the coverage of a taxonomy.
+
+    :param project_id: The project id.
+    :return: A JSON containing the number of parts providing and requiring each type.
+    """
+    return {
+        "provides": get_indexed_types(project_id, "provides"),
+        "requires": get_indexed_types(project_id, "requires"),
+    }
+
+
+@app.get("/data/types/{project_id}/{type_name}", response_class=FastResponse)
+async def get_joint_origins_for_type(
+    project_id: str,
+    type_name: str,
+    role: Literal["provides", "requires"] = "provides",
+    compatible: bool = True,
+):
+    """
+    Retrieves the JointOrigins that provide (or require) a type, from the type index
+    of the project.
+
+    :param project_id: The project id.
+    :param type_name: The suffixed type name, e.g. Cube_parts.
+    :param role: Either "provides" or "requires".
+    :param compatible: Whether to also include JointOrigins that provide a subtype of
+        the type (or require a supertype of it), as the taxonomy allows connecting them.
+    :return: A list of JSONs containing partId, jointOrigin and the matching type.
+    """
+    type_names = [type_name]
+    if compatible:
+        taxonomy = project_taxonomy(project_id)
+        type_names = [
+            indexed
+            for indexed in get_indexed_types(project_id, role)
+            if (
+                taxonomy.is_subtype(indexed, type_name)
+                if role == "provides"
+                else taxonomy.is_subtype(type_name, indexed)
+            )
+        ]
+    return get_joint_origins_for_types(project_id, type_names, role)
 
 
 @app.get("/results", response_class=FastResponse)
@@ -205,32 +645,21 @@ async def list_result_ids():
 
 
 @app.get("/results/{project_id}", response_class=FastResponse)
-async def list_project_ids(project_id: str):
+async def list_project_ids(project_id: str, request: Request):
     """
-    Lists all result metadata for a specific project id.
+    Lists all result metadata for a specific project id. Besides the metadata, each
+    result lists the maximum part counts, part frequencies, and the ranges of cost,
+    part count and link count across its assemblies. The response is compressed and
+    encoded as the client accepts, see negotiated_response.
 
     :param project_id: The project id for which to list metadata.
+    :param request: The request, to negotiate the response format.
     :return: A list of JSON objects describing the individual results. Each object has
         an "id" key.
     """
-    return [dict(x, id=x["_id"]) for x in get_all_result_ids_for_project(project_id)]
-
-
-async def cache_request(request_id, project_id: str):
-    """
-    Caches a specific synthesis result. Since these can be several Mb of JSON data, this
-    avoids unnecessary database accesses.
-
-    :param project_id: The id of the project of the result to be cached.
-    :param request_id: The id of the result to be cached.
-    :return: The JSON data of the result.
-    """
-    if f"{request_id}_{project_id}" not in cache:
-        cache[f"{request_id}_{project_id}"] = get_result_for_id_in_project(
-            request_id, project_id
-        )["interpretedTerms"]
-    results = cache[f"{request_id}_{project_id}"]
-    return results
+    return await negotiated_response(
+        request, [dict(x, id=x["_id"]) for x in summaries_for_project(project_id)]
+    )
 
 
 @app.get("/results/{project_id}/{request_id}/maxcounts", response_class=FastResponse)
@@ -241,87 +670,183 @@ async def maximum_counts_for_id(
     """
     Computes the maximum amount of a part across all assemblies contained in a synthesis
     result. This is used to create a template file that contains enough parts to
-    assemble any assembly from the results.
+    assemble any assembly from the results. The maximum counts are computed once, when
+    the result is stored, see summary_for_id.
 
     :param project_id: The project id of the project the result is from.
     :param request_id: The id of the result.
     :return: A JSON object containing all the maximum counts. "Invalid" if the request
         or project ids were invalid.
     """
-    try:
-        results = await cache_request(request_id, project_id)
-    except TypeError:
+    summary = summary_for_id(request_id, project_id)
+    if summary is None:
         return "Invalid"
-    part_counts: defaultdict[int] = defaultdict(int)
-    for result in results:
-        for document_id, data in result["quantities"].items():
-            part_counts[document_id] = (
-                data["count"]
-                if data["count"] > part_counts[document_id]
-                else part_counts[document_id]
-            )
-    return FastResponse(part_counts)
+    return FastResponse(summary["maxCounts"])
 
 
 @app.get("/results/{project_id}/{request_id}", response_class=FastResponse)
 async def results_for_id(
     project_id: str,
     request_id: str,
+    request: Request,
     skip: int = 0,
     limit: int = sys.maxsize,
+    pretty: bool = False,
 ):
     """
-    Returns the assemblies contained in a synthesis result.
+    Returns the assemblies contained in a synthesis result. Only the requested range is
+    read from the database, and the response is built from the cached encodings of the
+    individual assemblies. Since results never change, compressed or binary responses
+    are cached as well, see negotiated_response.
 
     :param project_id: The project id of the project the result is from.
     :param request_id: The id of the result.
+    :param request: The request, to negotiate the response format.
     :param skip: How many assemblies to skip from the start.
     :param limit: How many assemblies to return.
+    :param pretty: Whether to indent the JSON.
     :return: A list of assemblies of size up to limit. "Invalid" if the request or
         project ids were invalid.
     """
     if limit == 0:
         return []
 
-    try:
-        results = await cache_request(request_id, project_id)
-    except TypeError:
+    header = result_header(request_id, project_id)
+    if header is None:
         return "Invalid"
-    if (limit < 0 or limit > len(results)) and skip == 0:
-        return FastResponse(results)
-
-    return FastResponse(
-        [
-            results[result_id]
-            for result_id in range(
-                skip if skip < len(results) else len(results) - 1,
-                skip + limit if (skip + limit) <= len(results) else len(results),
-            )
-        ]
+    count = header["count"]
+    if (limit < 0 or limit > count) and skip == 0:
+        start, stop = 0, count
+    else:
+        start = skip if skip < count else count - 1
+        stop = skip + limit if (skip + limit) <= count else count
+
+    return await negotiated_response(
+        request,
+        encoded=lambda: json_array_bytes(cached_assembly_bytes(header, start, stop)),
+        pretty=pretty,
+        cache=response_cache,
+        cache_key=(request_id, project_id, start, stop),
+        etag=f"{content_hash(header)}-{start}-{stop}",
+        cache_control=immutable_cache_control,
     )
 
 
 @app.get("/results/{project_id}/{request_id}/{result_id}", response_class=FastResponse)
-async def results_for_result_id(project_id: str, request_id: str, result_id: int):
+async def results_for_result_id(
+    project_id: str,
+    request_id: str,
+    result_id: int,
+    request: Request,
+    pretty: bool = False,
+):
     """
-    Returns a single assembly from a synthesis result.
+    Returns a single assembly from a synthesis result. Only the chunk containing it is
+    read from the database. The response is compressed and encoded as the client
+    accepts, see negotiated_response.
 
     :param project_id: The project id of the project the result is from.
     :param request_id: The id of the result.
     :param result_id: The index of the assembly in the result.
+    :param request: The request, to negotiate the response format.
+    :param pretty: Whether to indent the JSON.
     :return: The assembly, or "" if the index did not exist. "Invalid" if the request or
         project ids were invalid.
     """
-    try:
-        results = await cache_request(request_id, project_id)
-    except TypeError:
+    header = result_header(request_id, project_id)
+    if header is None:
         return "Invalid"
-    if result_id < len(results) or len(results) == -1:
-        return FastResponse(results[result_id])
+    if result_id < 0:
+        result_id += header["count"]
+    if 0 <= result_id < header["count"]:
+        return await negotiated_response(
+            request,
+            encoded=lambda: cached_assembly_bytes(header, result_id, result_id + 1)[0],
+            pretty=pretty,
+            cache=response_cache,
+            cache_key=(request_id, project_id, result_id),
+            etag=f"{content_hash(header)}-{result_id}",
+            cache_control=immutable_cache_control,
+        )
     else:
         return ""
 
 
+@app.get("/admin/indexes", response_class=FastResponse)
+async def database_indexes():
+    """
+    Reports the database indexes and the query plans of the frequent queries, to check
+    that no synthesis or result listing has to scan a whole collection. Only available
+    if enabled in the settings (CLS_CAD_ADMIN).
+
+    :return: A JSON describing the indexes and query plans, or Invalid if disabled.
+    """
+    if not ADMIN_ENABLED:
+        return "Invalid"
+    return index_report()
+
+
+@app.post("/admin/migrate/results", response_class=FastResponse)
+async def migrate_results():
+    """
+    Migrates all results stored in a single document to chunked storage. Such results
+    are otherwise migrated when they are first retrieved. Only available if enabled in
+    the settings (CLS_CAD_ADMIN).
+
+    :return: A JSON containing the number of migrated results, or Invalid if disabled.
+    """
+    if not ADMIN_ENABLED:
+        return "Invalid"
+    return {"migrated": migrate_results_to_chunks()}
+
+
+@app.get("/admin/caches", response_class=FastResponse)
+async def cache_statistics():
+    """
+    Reports the size and hit rates of the in-memory caches. Only available if enabled
+    in the settings (CLS_CAD_ADMIN).
+
+    :return: A JSON containing statistics for the result, repository and cursor caches,
+        or Invalid if disabled.
+    """
+    if not ADMIN_ENABLED:
+        return "Invalid"
+    return {
+        "results": result_cache.stats(),
+        "responses": response_cache.stats(),
+        "repositories": RepositoryBuilder.cache.stats(),
+        "cursors": cursors.stats(),
+    }
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def download_profile(profile_id: str, artifact: str = "cpu"):
+    """
+    Downloads a profile of a synthesis request, see /request/assembly.
+
+    :param profile_id: The id of the profile.
+    :param artifact: "cpu" for the cProfile data (readable with pstats or snakeviz) or
+        "summary" for a text summary of the slowest functions and top allocations.
+    :return: The file, or Invalid if profiling is disabled or there is no such profile.
+    """
+    path = saved_artifact(profile_id, artifact) if PROFILING_ENABLED else None
+    if path is None:
+        return "Invalid"
+    return FileResponse(path, filename=os.path.basename(path))
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Exposes the counters and histograms of synthesis requests (outcomes, time spent per
+    phase, repository, grammar and literal domain sizes, enumerated terms) in the
+    Prometheus text format.
+
+    :return: The metrics.
+    """
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
+
+
 # Finally, mount webpage for root.
 app.mount(
     "/",
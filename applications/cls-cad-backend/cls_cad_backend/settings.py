@@ -0,0 +1,78 @@
+import os
+
+
+def _int_setting(name: str, default: int) -> int:
+    """
+    Reads an integer setting from the environment, falling back to a default if the
+    variable is unset or empty.
+
+    :param name: The name of the environment variable.
+    :param default: The value to use if the variable is not set.
+    :return: The configured value.
+    """
+    value = os.environ.get(name, "")
+    return int(value) if value.strip() else default
+
+
+# How many repositories (per project and constraint set) are kept in memory.
+REPOSITORY_CACHE_SIZE = _int_setting("CLS_CAD_REPOSITORY_CACHE_SIZE", 8)
+
+# How many taxonomies (per project and taxonomy version) are kept in memory, inverted
+# for /data/taxonomy and merged (with their subtype closure) for synthesis.
+INVERTED_TAXONOMY_CACHE_SIZE = _int_setting("CLS_CAD_INVERTED_TAXONOMY_CACHE_SIZE", 32)
+MERGED_TAXONOMY_CACHE_SIZE = _int_setting("CLS_CAD_MERGED_TAXONOMY_CACHE_SIZE", 32)
+
+# For how many projects (per parts version) the types provided by their JointOrigins
+# are kept in memory for feasibility checks.
+PROVIDED_TYPES_CACHE_SIZE = _int_setting("CLS_CAD_PROVIDED_TYPES_CACHE_SIZE", 32)
+
+# How many worker processes execute asynchronous synthesis jobs.
+SYNTHESIS_WORKERS = _int_setting(
+    "CLS_CAD_SYNTHESIS_WORKERS", max(1, (os.cpu_count() or 2) // 2)
+)
+
+# How long the state of a finished asynchronous synthesis job is kept, in seconds.
+JOB_RETENTION_SECONDS = _int_setting("CLS_CAD_JOB_RETENTION_SECONDS", 3600)
+
+# How many enumeration cursors are kept, and for how many seconds after their last use.
+CURSOR_CACHE_SIZE = _int_setting("CLS_CAD_CURSOR_CACHE_SIZE", 16)
+CURSOR_TTL_SECONDS = _int_setting("CLS_CAD_CURSOR_TTL_SECONDS", 900)
+
+# Post-processing of at least this many terms is split into chunks and distributed
+# to worker processes.
+POSTPROCESS_PARALLEL_THRESHOLD = _int_setting("CLS_CAD_POSTPROCESS_THRESHOLD", 64)
+POSTPROCESS_CHUNK_SIZE = _int_setting("CLS_CAD_POSTPROCESS_CHUNK_SIZE", 16)
+POSTPROCESS_WORKERS = _int_setting("CLS_CAD_POSTPROCESS_WORKERS", os.cpu_count() or 1)
+
+# How many chunks of synthesis results (see RESULT_CHUNK_SIZE) are kept in memory for
+# the results endpoints, their total (compact JSON) size in bytes, and for how many
+# seconds after they were loaded.
+RESULT_CACHE_SIZE = _int_setting("CLS_CAD_RESULT_CACHE_SIZE", 1024)
+RESULT_CACHE_BYTES = _int_setting("CLS_CAD_RESULT_CACHE_BYTES", 256 * 1024 * 1024)
+RESULT_CACHE_TTL_SECONDS = _int_setting("CLS_CAD_RESULT_CACHE_TTL_SECONDS", 3600)
+
+# How many assemblies of a synthesis result are stored together in one document.
+RESULT_CHUNK_SIZE = _int_setting("CLS_CAD_RESULT_CHUNK_SIZE", 50)
+
+# How the assemblies of stored synthesis results are encoded: "none" (plain documents),
+# "zlib" or "zstd" (compressed, zstd requires the zstandard package, else zlib is used).
+RESULT_CODEC = os.environ.get("CLS_CAD_RESULT_CODEC", "").strip() or "zlib"
+
+# Responses smaller than this many bytes are not compressed.
+COMPRESSION_MIN_SIZE = _int_setting("CLS_CAD_COMPRESSION_MIN_SIZE", 1024)
+
+# How many compressed (or binary) responses for synthesis results are kept in memory,
+# and their total size in bytes.
+RESPONSE_CACHE_SIZE = _int_setting("CLS_CAD_RESPONSE_CACHE_SIZE", 256)
+RESPONSE_CACHE_BYTES = _int_setting("CLS_CAD_RESPONSE_CACHE_BYTES", 64 * 1024 * 1024)
+
+# Whether the maintenance endpoints (/admin/indexes, /admin/caches and
+# /admin/migrate/results) are available.
+ADMIN_ENABLED = _int_setting("CLS_CAD_ADMIN", 0) != 0
+
+# Whether single synthesis requests may be profiled (profile=1 on /request/assembly),
+# and the folder the profiles are saved in, see /admin/profiles/{profile_id}.
+PROFILING_ENABLED = _int_setting("CLS_CAD_PROFILING", 0) != 0
+PROFILES_DIRECTORY = os.environ.get("CLS_CAD_PROFILES_DIRECTORY", "").strip() or (
+    os.path.join(os.path.dirname(__file__), "profiles")
+)
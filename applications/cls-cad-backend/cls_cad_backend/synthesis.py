@@ -0,0 +1,409 @@
+import hashlib
+import json
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import chain, islice
+from threading import Lock
+
+from cls_cad_backend.ranking import grammar_items, ranked_terms, rankings
+from cls_cad_backend.repository_builder import wrapped_counted_types
+from cls_cad_backend.schemas import SynthesisRequestInf
+from cls_cad_backend.settings import (
+    CURSOR_CACHE_SIZE,
+    CURSOR_TTL_SECONDS,
+    POSTPROCESS_CHUNK_SIZE,
+    POSTPROCESS_PARALLEL_THRESHOLD,
+    POSTPROCESS_WORKERS,
+)
+from cls_cad_backend.util.cache import LRUCache
+from cls_cad_backend.util.json_operations import postprocess, suffix_and_merge_taxonomy
+from cls_cad_backend.util.metrics import (
+    add_phases,
+    current_trace,
+    record_size,
+    timed,
+    traced,
+)
+from cls_cad_backend.util.subtypes import Taxonomy
+from clsp import (
+    Constructor,
+    FiniteCombinatoryLogic,
+    Subtypes,
+    Type,
+    enumerate_terms,
+    interpret_term,
+)
+from clsp.types import Literal, Omega
+
+
+def part_counts_of(
+    payload: SynthesisRequestInf,
+) -> list[tuple[list[str], int, str]] | None:
+    """
+    Extracts the counting constraints of a synthesis request in the form the
+    RepositoryBuilder expects them.
+
+    :param payload: The synthesis request.
+    :return: A list of tuples of counted types, number and name, or None if the request
+        has no counting constraints.
+    """
+    if not payload.partCounts:
+        return None
+    return [(p.partType, p.partNumber, p.partCountName) for p in payload.partCounts]
+
+
+def request_fingerprint(payload: SynthesisRequestInf, versions: tuple[int, int]) -> str:
+    """
+    Computes a canonical fingerprint of a synthesis request. Requests with the same
+    fingerprint on a project whose parts and taxonomy did not change have the same
+    results. The name of the request and the order of targets and counting constraints
+    do not matter.
+
+    :param payload: The synthesis request.
+    :param versions: The parts and taxonomy versions of the project, see
+        get_project_versions.
+    :return: The fingerprint.
+    """
+    canonical = {
+        "forgeProjectId": payload.forgeProjectId,
+        "versions": list(versions),
+        "target": sorted(set(payload.target)),
+        "partCounts": sorted(
+            [sorted(p.partType), p.partNumber, p.partCountName]
+            for p in payload.partCounts or []
+        ),
+        "pageSize": payload.pageSize,
+        "rankBy": payload.rankBy,
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+def build_query(payload: SynthesisRequestInf) -> tuple[Type, dict[str, list[int]]]:
+    """
+    Builds the clsp query and the literal domains for a synthesis request. Each target
+    type is annotated with the requested part counts.
+
+    :param payload: The synthesis request.
+    :return: A tuple of the query type and the literals.
+    """
+    literals = {}
+    part_count_type = Omega()
+    if payload.partCounts:
+        for partCount in payload.partCounts:
+            literals[partCount.partCountName] = list(range(partCount.partNumber + 1))
+        part_count_type = wrapped_counted_types(
+            [Literal(c.partNumber, c.partCountName) for c in payload.partCounts]
+        )
+
+    query = Type.intersect([Constructor(x, part_count_type) for x in payload.target])
+    return query, literals
+
+
+def load_taxonomy(taxonomy: dict) -> Taxonomy:
+    """
+    Converts a taxonomy as stored in the database into the subtype environment used by
+    clsp, including the subtype closure used by the backend, see Taxonomy.
+
+    :param taxonomy: The taxonomy JSON of a project.
+    :return: The merged taxonomy.
+    """
+    with timed("merge_taxonomy"):
+        return Taxonomy(suffix_and_merge_taxonomy(taxonomy))
+
+
+def synthesize(
+    payload: SynthesisRequestInf,
+    taxonomy: Subtypes,
+    repository: dict,
+    *,
+    max_count: int = 100,
+    on_phase: Callable[[str], None] | None = None,
+    parallel: bool = True,
+) -> list[dict]:
+    """
+    Executes clsp for a synthesis request on an already built repository. Results (if
+    present) get enumerated (up to max_count) and then post-processed into assembly
+    instructions.
+
+    :param payload: The synthesis request.
+    :param taxonomy: The taxonomy the repository was built with.
+    :param repository: The repository containing all part combinators.
+    :param max_count: The maximum number of terms to enumerate.
+    :param on_phase: Optionally called with "inhabiting" before inhabitation and with
+        "enumerating" before each enumerated term. It may raise to abort synthesis.
+    :param parallel: Whether many terms may be post-processed in the worker pool.
+    :return: The list of post-processed assemblies, empty if there are none.
+    """
+    on_phase = on_phase or (lambda phase: None)
+    query, grammar = inhabit(payload, taxonomy, repository, on_phase=on_phase)
+
+    on_phase("enumerating")
+    terms = []
+    with timed("enumerate"):
+        for term in select_terms(payload, query, grammar, max_count):
+            on_phase("enumerating")
+            terms.append(term)
+    record_size("terms", len(terms))
+    return interpret_terms(terms, parallel=parallel)
+
+
+def iterate_synthesis(
+    payload: SynthesisRequestInf,
+    taxonomy: Subtypes,
+    repository: dict,
+    *,
+    max_count: int = 100,
+    on_phase: Callable[[str], None] | None = None,
+) -> Iterator[dict]:
+    """
+    Like synthesize, but yields each post-processed assembly as soon as its term is
+    enumerated.
+
+    :param payload: The synthesis request.
+    :param taxonomy: The taxonomy the repository was built with.
+    :param repository: The repository containing all part combinators.
+    :param max_count: The maximum number of terms to enumerate.
+    :param on_phase: Optionally called with "inhabiting" before inhabitation and with
+        "enumerating" before each enumerated term. It may raise to abort synthesis.
+    :return: An iterator over the post-processed assemblies.
+    """
+    on_phase = on_phase or (lambda phase: None)
+    query, grammar = inhabit(payload, taxonomy, repository, on_phase=on_phase)
+
+    on_phase("enumerating")
+    for term in select_terms(payload, query, grammar, max_count):
+        on_phase("enumerating")
+        yield postprocess(interpret_term(term))
+
+
+def select_terms(
+    payload: SynthesisRequestInf, query: Type, grammar, max_count: int
+) -> Iterable:
+    """
+    Enumerates the terms of a tree grammar, either in enumeration order or best first
+    if the synthesis request asks for it, see ranked_terms.
+
+    :param payload: The synthesis request.
+    :param query: The query that was inhabited.
+    :param grammar: The resulting tree grammar.
+    :param max_count: The maximum number of terms to return.
+    :return: The terms.
+    """
+    if payload.rankBy:
+        return islice(ranked_terms(query, grammar, rankings[payload.rankBy]), max_count)
+    return enumerate_terms(query, grammar, max_count=max_count)
+
+
+def interpret_chunk(terms: list) -> list[dict]:
+    """
+    Interprets and post-processes a list of terms. This is the unit of work that gets
+    sent to the worker pool.
+
+    :param terms: The terms.
+    :return: The post-processed assemblies, in the same order.
+    """
+    with timed("interpret"):
+        interpreted = [interpret_term(term) for term in terms]
+    with timed("postprocess"):
+        return [postprocess(data) for data in interpreted]
+
+
+def traced_interpret_chunk(terms: list) -> tuple[list[dict], dict[str, float]]:
+    """
+    Like interpret_chunk, but also returns how long interpretation and post-processing
+    took, since worker processes cannot add to the trace of the request.
+
+    :param terms: The terms.
+    :return: A tuple of the post-processed assemblies and the timings per phase.
+    """
+    with traced("") as trace:
+        return interpret_chunk(terms), dict(trace.phases)
+
+
+def interpret_terms(terms: list, *, parallel: bool = True) -> list[dict]:
+    """
+    Interprets and post-processes terms. Above a size threshold, the terms are split
+    into chunks that are processed in a pool of worker processes. Below it, sending the
+    terms to other processes costs more than it saves.
+
+    :param terms: The terms.
+    :param parallel: Whether the worker pool may be used.
+    :return: The post-processed assemblies, in the same order as the terms.
+    """
+    if not parallel or len(terms) < POSTPROCESS_PARALLEL_THRESHOLD:
+        return interpret_chunk(terms)
+    chunks = [
+        terms[i : i + POSTPROCESS_CHUNK_SIZE]
+        for i in range(0, len(terms), POSTPROCESS_CHUNK_SIZE)
+    ]
+    if current_trace.get() is None:
+        return list(
+            chain.from_iterable(postprocess_pool().map(interpret_chunk, chunks))
+        )
+    assemblies = []
+    for page, phases in postprocess_pool().map(traced_interpret_chunk, chunks):
+        assemblies.extend(page)
+        add_phases(phases)
+    return assemblies
+
+
+postprocess_executor: ProcessPoolExecutor | None = None
+postprocess_lock = Lock()
+
+
+def postprocess_pool() -> ProcessPoolExecutor:
+    """
+    Lazily starts the worker processes for post-processing.
+
+    :return: The pool of worker processes.
+    """
+    global postprocess_executor
+    with postprocess_lock:
+        if postprocess_executor is None:
+            postprocess_executor = ProcessPoolExecutor(max_workers=POSTPROCESS_WORKERS)
+        return postprocess_executor
+
+
+def shutdown_postprocess_pool() -> None:
+    """
+    Stops the worker processes for post-processing.
+
+    :return:
+    """
+    global postprocess_executor
+    with postprocess_lock:
+        if postprocess_executor is not None:
+            postprocess_executor.shutdown(wait=False, cancel_futures=True)
+        postprocess_executor = None
+
+
+def inhabit(
+    payload: SynthesisRequestInf,
+    taxonomy: Subtypes,
+    repository: dict,
+    *,
+    on_phase: Callable[[str], None] | None = None,
+):
+    """
+    Builds the query for a synthesis request and executes clsp on an already built
+    repository.
+
+    :param payload: The synthesis request.
+    :param taxonomy: The taxonomy the repository was built with.
+    :param repository: The repository containing all part combinators.
+    :param on_phase: Optionally called with "inhabiting" before inhabitation.
+    :return: A tuple of the query and the resulting tree grammar.
+    """
+    query, literals = build_query(payload)
+
+    gamma = FiniteCombinatoryLogic(
+        repository,
+        subtypes=taxonomy,
+        literals=literals,
+    )
+
+    if on_phase:
+        on_phase("inhabiting")
+    with timed("inhabit"):
+        grammar = gamma.inhabit(query)
+    record_size("repository", len(repository))
+    record_size("literals", {name: len(values) for name, values in literals.items()})
+    record_size("grammar", sum(len(rules) for _, rules in grammar_items(grammar)))
+    return query, grammar
+
+
+class EnumerationCursor:
+    """
+    Keeps the tree grammar of a synthesis request, so that further assemblies can be
+    enumerated page by page without executing clsp again. Pages of the same cursor are
+    enumerated one after another, even if they are requested concurrently.
+    """
+
+    def __init__(self, payload: SynthesisRequestInf, query: Type, grammar) -> None:
+        """
+        Starts the enumeration of a tree grammar.
+
+        :param payload: The synthesis request the grammar was inhabited for.
+        :param query: The query that was inhabited.
+        :param grammar: The resulting tree grammar.
+        """
+        self.payload = payload
+        self.offset = 0
+        self.exhausted = False
+        self._terms = enumerate_terms(query, grammar, max_count=None)
+        self._lookahead = []
+        self._lock = Lock()
+
+    def next_page(self, count: int, *, parallel: bool = True) -> tuple[int, list[dict]]:
+        """
+        Enumerates and post-processes the next terms. One additional term is enumerated
+        ahead, to know whether the enumeration is exhausted after this page.
+
+        :param count: The maximum number of assemblies to return.
+        :param parallel: Whether many terms may be post-processed in the worker pool.
+        :return: A tuple of how many assemblies were enumerated before this page and the
+            post-processed assemblies, empty if the enumeration is exhausted.
+        """
+        with self._lock:
+            offset = self.offset
+            with timed("enumerate"):
+                terms = list(islice(chain(self._lookahead, self._terms), count + 1))
+            record_size("terms", len(terms))
+            self._lookahead = terms[count:]
+            self.exhausted = not self._lookahead
+            page = interpret_terms(terms[:count], parallel=parallel)
+            self.offset += len(page)
+            return offset, page
+
+
+cursors = LRUCache(CURSOR_CACHE_SIZE, ttl=CURSOR_TTL_SECONDS)
+
+
+def result_document(
+    request_id: str,
+    payload: SynthesisRequestInf,
+    interpreted_terms: list[dict],
+    offset: int = 0,
+    fingerprint: str | None = None,
+) -> dict:
+    """
+    Bundles the post-processed assemblies of a synthesis request into a single JSON
+    Object, as it is stored in the database.
+
+    :param request_id: The id of the result.
+    :param payload: The synthesis request.
+    :param interpreted_terms: The post-processed assemblies.
+    :param offset: How many assemblies of the same synthesis request were enumerated
+        before these, when paging through a cursor.
+    :param fingerprint: The fingerprint of the synthesis request, see
+        request_fingerprint. Only for the first page of results.
+    :return: The result JSON.
+    """
+    result = {
+        "_id": request_id,
+        "forgeProjectId": payload.forgeProjectId,
+        "name": payload.name,
+        "timestamp": datetime.today().strftime("%Y-%m-%d %H:%M:%S"),
+        "count": len(interpreted_terms),
+        "offset": offset,
+        "interpretedTerms": interpreted_terms,
+        "payload": payload.model_dump(),
+    }
+    if fingerprint is not None:
+        result["fingerprint"] = fingerprint
+    return result
+
+
+def result_metadata(result: dict) -> dict:
+    """
+    Reduces a result JSON to the metadata that is returned to the client.
+
+    :param result: The result JSON.
+    :return: The result JSON without the assemblies and the request payload.
+    """
+    return {
+        key: value
+        for key, value in result.items()
+        if key not in ("interpretedTerms", "payload")
+    }
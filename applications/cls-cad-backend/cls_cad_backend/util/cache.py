@@ -0,0 +1,154 @@
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from threading import RLock
+from time import monotonic
+from typing import Any
+
+_missing = object()
+
+
+class LRUCache:
+    """
+    A small thread-safe least-recently-used cache. Once more than max_entries entries
+    are stored, the entry that was accessed the longest time ago is evicted. Optionally,
+    entries expire a fixed time after they were stored, and the total size of all
+    entries is limited to max_bytes, as measured by size_of.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl: float | None = None,
+        *,
+        max_bytes: int | None = None,
+        size_of: Callable[[Any], int] | None = None,
+    ) -> None:
+        """
+        Creates an empty cache.
+
+        :param max_entries: The maximum number of entries to keep.
+        :param ttl: The number of seconds after which an entry expires, or None if
+            entries never expire.
+        :param max_bytes: The maximum total size of all entries, or None if only the
+            number of entries is limited. Larger values are not cached at all.
+        :param size_of: Computes the size of a value in bytes. Required for max_bytes.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size_of = size_of or (lambda value: 0)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, float, int]] = OrderedDict()
+        self._lock = RLock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Retrieves an entry and marks it as the most recently used one.
+
+        :param key: The key of the entry.
+        :param default: The value to return if the key is not cached.
+        :return: The cached value, or default.
+        """
+        with self._lock:
+            value, expires, _ = self._entries.get(key, (_missing, None, 0))
+            if value is not _missing and expires is not None and expires < monotonic():
+                self._remove(key)
+                self.expirations += 1
+                value = _missing
+            if value is _missing:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Stores an entry, evicting the least recently used entries if necessary.
+
+        :param key: The key of the entry.
+        :param value: The value to cache.
+        :return:
+        """
+        size = self.size_of(value)
+        with self._lock:
+            self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            expires = None if self.ttl is None else monotonic() + self.ttl
+            self._entries[key] = (value, expires, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or (
+                self.max_bytes is not None and self.bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Retrieves an entry, computing and storing it first if it is not cached.
+
+        :param key: The key of the entry.
+        :param compute: Called without arguments to create a missing value.
+        :return: The cached or newly computed value.
+        """
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> None:
+        """
+        Removes all entries whose key matches a predicate.
+
+        :param predicate: Called with each key, True removes the entry.
+        :return:
+        """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        """
+        Removes all entries.
+
+        :return:
+        """
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        """
+        Describes the current size of the cache and how well it performed so far.
+
+        :return: A JSON containing the number of entries, their total size, and the
+            numbers of hits, misses, evictions and expirations.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "maxEntries": self.max_entries,
+                "bytes": self.bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key, (None, None, 0))
+        self.bytes -= size
+
+    def __contains__(self, key: Hashable) -> bool:
+        _, expires, _ = self._entries.get(key, (_missing, 0.0, 0))
+        return expires is None or expires >= monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
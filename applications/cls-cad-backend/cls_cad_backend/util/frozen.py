@@ -0,0 +1,49 @@
+import sys
+from typing import Any
+
+
+class FrozenDict(dict):
+    """
+    A dict that can not be modified after creation. Its hash is computed once, on first
+    use, from its contents.
+    """
+
+    __slots__ = ("_hash", "__weakref__")
+
+    def __hash__(self) -> int:
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(frozenset(self.items()))
+            return self._hash
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("FrozenDict can not be modified")
+
+    __setitem__ = __delitem__ = __ior__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+
+
+def freeze(value: Any) -> Any:
+    """
+    Recursively converts a JSON-like structure into an immutable, hashable one. Dicts
+    become FrozenDicts, lists become tuples and strings are interned.
+
+    :param value: The structure to convert.
+    :return: The converted structure.
+    """
+    if isinstance(value, FrozenDict):
+        return value
+    if isinstance(value, dict):
+        return FrozenDict(
+            (sys.intern(k) if isinstance(k, str) else k, freeze(v))
+            for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
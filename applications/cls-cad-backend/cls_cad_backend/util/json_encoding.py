@@ -0,0 +1,49 @@
+import json
+import typing
+
+base_json = True
+try:  # pragma: no cover
+    import orjson
+    import ujson
+
+    base_json = False
+except ImportError:  # pragma: no cover
+    pass
+
+
+def json_bytes(content: typing.Any, *, pretty: bool = True) -> bytes:
+    """
+    Encodes content into a JSON. When not running on PyPy, uses faster JSON encoders in
+    a cascading fashion based on maximum JSON depth.
+
+    :param content: The content to encode.
+    :param pretty: Whether to indent the JSON. Compact JSON contains no newlines.
+    :return: The encoded content.
+    """
+    indent = 2 if pretty else None
+    separators = None if pretty else (",", ":")
+    if base_json:  # pragma: no cover
+        return json.dumps(
+            content, indent=indent, separators=separators, ensure_ascii=False
+        ).encode("utf-8")
+    try:  # pragma: no cover
+        return orjson.dumps(content, option=orjson.OPT_INDENT_2 if pretty else None)
+    except TypeError:  # pragma: no cover
+        try:
+            return ujson.dumps(content, indent=indent or 0, ensure_ascii=False).encode(
+                "utf-8"
+            )
+        except OverflowError:
+            return json.dumps(
+                content, indent=indent, separators=separators, ensure_ascii=False
+            ).encode("utf-8")
+
+
+def json_array_bytes(fragments: typing.Iterable[bytes]) -> bytes:
+    """
+    Joins already encoded JSON values into a JSON array without decoding them.
+
+    :param fragments: The encoded values.
+    :return: The encoded array.
+    """
+    return b"[" + b",".join(fragments) + b"]"
@@ -34,7 +34,7 @@ def postprocess(data: dict | Part):
         "name": name,
         "cost": total_cost,
         "count": total_count,
-        "quantities": part_counts,
+        "quantities": dict(part_counts),
         "links": link_index + 1,
         "instructions": instructions,
     }
@@ -70,7 +70,8 @@ def resolve_multiplicity(data: dict):
 def compute_insertions_and_totals(data: dict) -> tuple:
     """
     Aggregates all parts present in the tree-like assembly dictionary, computing their
-    total counts and costs.
+    total counts and costs. Parts that were chosen from a class of equivalent parts
+    also list the alternatives.
 
     :param data: The tree-like dictionary.
     :return: A dictionary of part counts and costs.
@@ -83,6 +84,8 @@ def compute_insertions_and_totals(data: dict) -> tuple:
         part_counts[v["forgeDocumentId"]]["count"] += v["count"]
         part_counts[v["forgeDocumentId"]]["cost"] += v["cost"]
         part_counts[v["forgeDocumentId"]]["name"] = re.sub("v[0-9]+$", "", v["name"])
+        if "alternatives" in v:
+            part_counts[v["forgeDocumentId"]]["alternatives"] = v["alternatives"]
         total_count += v["count"]
         total_cost += v["cost"]
         to_traverse.extend(v["connections"])
@@ -133,6 +136,36 @@ def remove_unused_keys_from_part_json(data: dict):
     return data
 
 
+def summarize_assemblies(interpreted_terms: list[dict]) -> dict:
+    """
+    Aggregates a list of post-processed assemblies into a small summary: the maximum
+    count of each part across all assemblies (as needed for templates containing enough
+    parts for any assembly), in how many assemblies each part is used, and the ranges of
+    total cost, part count and link count.
+
+    :param interpreted_terms: The post-processed assemblies.
+    :return: The summary.
+    """
+    max_counts: defaultdict[str, int] = defaultdict(int)
+    part_frequency: defaultdict[str, int] = defaultdict(int)
+    for assembly in interpreted_terms:
+        for document_id, data in assembly["quantities"].items():
+            max_counts[document_id] = max(max_counts[document_id], data["count"])
+            part_frequency[document_id] += 1
+
+    def value_range(key: str) -> dict | None:
+        values = [assembly[key] for assembly in interpreted_terms]
+        return {"min": min(values), "max": max(values)} if values else None
+
+    return {
+        "maxCounts": dict(max_counts),
+        "partFrequency": dict(part_frequency),
+        "costRange": value_range("cost"),
+        "countRange": value_range("count"),
+        "linksRange": value_range("links"),
+    }
+
+
 def invert_taxonomy(taxonomy):
     """
     Converts a taxonomy where the keys denote supertypes to one where the keys denote
@@ -0,0 +1,311 @@
+import json
+import logging
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from timeit import default_timer as timer
+
+logger = logging.getLogger("cls_cad_backend.synthesis")
+if not logger.handlers:  # pragma: no cover
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class Counter:
+    """
+    A Prometheus counter, optionally with labels.
+    """
+
+    def __init__(
+        self, name: str, documentation: str, metrics: list | None = None
+    ) -> None:
+        """
+        Creates a counter and registers it for /metrics.
+
+        :param name: The metric name.
+        :param documentation: The help text.
+        :param metrics: The registry to register in, the global registry by default.
+        """
+        self.name = name
+        self.documentation = documentation
+        self._values: defaultdict[tuple, float] = defaultdict(float)
+        self._lock = Lock()
+        (registry if metrics is None else metrics).append(self)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """
+        Increments the counter.
+
+        :param amount: The amount to add.
+        :param labels: The label values.
+        :return:
+        """
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] += amount
+
+    def exposition(self) -> list[str]:
+        """
+        Renders the counter in the Prometheus text format.
+
+        :return: The lines.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{label_text(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    A Prometheus histogram with fixed buckets, optionally with labels.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: tuple[float, ...],
+        metrics: list | None = None,
+    ) -> None:
+        """
+        Creates a histogram and registers it for /metrics.
+
+        :param name: The metric name.
+        :param documentation: The help text.
+        :param buckets: The ascending upper bounds of the buckets, without +Inf.
+        :param metrics: The registry to register in, the global registry by default.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._counts: dict[tuple, list[int]] = {}
+        self._sums: defaultdict[tuple, float] = defaultdict(float)
+        self._lock = Lock()
+        (registry if metrics is None else metrics).append(self)
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        Records an observation.
+
+        :param value: The observed value.
+        :param labels: The label values.
+        :return:
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._sums[key] += value
+
+    def exposition(self) -> list[str]:
+        """
+        Renders the histogram in the Prometheus text format, with cumulative buckets.
+
+        :return: The lines.
+        """
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            for labels, counts in sorted(self._counts.items()):
+                total = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    total += count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    bucket_labels = label_text(labels + (("le", le),))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {total}")
+                lines.append(
+                    f"{self.name}_sum{label_text(labels)} {self._sums[labels]}"
+                )
+                lines.append(f"{self.name}_count{label_text(labels)} {total}")
+        return lines
+
+
+def label_text(labels: tuple[tuple[str, str], ...]) -> str:
+    """
+    Renders label values in the Prometheus text format.
+
+    :param labels: Pairs of label names and values.
+    :return: The labels in braces, or an empty string if there are none.
+    """
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+registry: list[Counter | Histogram] = []
+
+size_buckets = (1, 10, 100, 1000, 10000, 100000, 1000000)
+
+synthesis_requests = Counter(
+    "synthesis_requests_total",
+    "Synthesis requests by outcome "
+    "(results, fail, infeasible, error, reused or coalesced).",
+)
+phase_seconds = Histogram(
+    "synthesis_phase_seconds",
+    "Time spent in each phase of a synthesis request.",
+    (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300),
+)
+sizes = {
+    "repository": Histogram(
+        "synthesis_repository_combinators",
+        "Number of combinators in the repository of a synthesis request.",
+        size_buckets,
+    ),
+    "grammar": Histogram(
+        "synthesis_grammar_rules",
+        "Number of rules in the tree grammar resulting from inhabitation.",
+        size_buckets,
+    ),
+    "literals": Histogram(
+        "synthesis_literal_domain_size",
+        "Size of each literal domain (part count) of a synthesis request.",
+        size_buckets,
+    ),
+    "terms": Histogram(
+        "synthesis_terms",
+        "Number of terms enumerated for a synthesis request.",
+        size_buckets,
+    ),
+}
+
+
+def render(metrics: list | None = None) -> str:
+    """
+    Renders all registered metrics in the Prometheus text format.
+
+    :param metrics: The registry to render, the global registry by default.
+    :return: The text for /metrics.
+    """
+    metrics = registry if metrics is None else metrics
+    return "\n".join(line for metric in metrics for line in metric.exposition()) + "\n"
+
+
+class SynthesisTrace:
+    """
+    Collects the phase timings and sizes of a single synthesis request.
+    """
+
+    def __init__(self, request_id: str) -> None:
+        """
+        Creates an empty trace.
+
+        :param request_id: The id to identify the request in the logs.
+        """
+        self.request_id = request_id
+        self.phases: defaultdict[str, float] = defaultdict(float)
+        self.sizes: dict[str, int | dict[str, int]] = {}
+
+
+current_trace: ContextVar[SynthesisTrace | None] = ContextVar(
+    "current_trace", default=None
+)
+
+
+@contextmanager
+def traced(request_id: str) -> Iterator[SynthesisTrace]:
+    """
+    Makes a new trace the current one, so that timed and record_size add to it.
+
+    :param request_id: The id to identify the request in the logs.
+    :return: The trace.
+    """
+    trace = SynthesisTrace(request_id)
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """
+    Adds the time spent in the block to a phase of the current trace. Does nothing
+    outside a trace, for example in worker processes.
+
+    :param phase: The name of the phase.
+    :return:
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = timer()
+    try:
+        yield
+    finally:
+        trace.phases[phase] += timer() - start
+
+
+def record_size(name: str, value: int | dict[str, int]) -> None:
+    """
+    Records a size in the current trace. Does nothing outside a trace.
+
+    :param name: One of "repository", "grammar", "literals" (a size per literal name)
+        or "terms".
+    :param value: The size.
+    :return:
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.sizes[name] = value
+
+
+def add_phases(phases: dict[str, float]) -> None:
+    """
+    Adds phase timings measured elsewhere (in a worker process) to the current trace.
+
+    :param phases: The timings per phase.
+    :return:
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        for phase, seconds in phases.items():
+            trace.phases[phase] += seconds
+
+
+def publish(trace: SynthesisTrace, event: str, outcome: str | None = None) -> None:
+    """
+    Records a finished trace in the metrics and writes it to the log as a JSON line.
+
+    :param trace: The trace.
+    :param event: What was traced, "synthesis" or "persist".
+    :param outcome: The outcome of a synthesis request, see synthesis_requests, or None
+        to not count the trace as a request.
+    :return:
+    """
+    if outcome is not None:
+        synthesis_requests.inc(outcome=outcome)
+    for phase, seconds in trace.phases.items():
+        phase_seconds.observe(seconds, phase=phase)
+    for name, value in trace.sizes.items():
+        for size in value.values() if isinstance(value, dict) else [value]:
+            sizes[name].observe(size)
+    logger.info(
+        json.dumps(
+            {
+                "event": event,
+                "requestId": trace.request_id,
+                "outcome": outcome,
+                "phases": dict(trace.phases),
+                "sizes": trace.sizes,
+            }
+        )
+    )
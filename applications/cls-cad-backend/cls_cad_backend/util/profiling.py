@@ -0,0 +1,134 @@
+import cProfile
+import io
+import os
+import pstats
+import tracemalloc
+from collections.abc import Callable
+from threading import Lock
+from typing import Any
+
+from cls_cad_backend.settings import PROFILES_DIRECTORY
+
+# The files saved for a profile, by artifact name.
+artifacts = {
+    "cpu": "{}.prof",
+    "summary": "{}.txt",
+}
+
+# Memory profiles share tracemalloc, which is started for the first running memory
+# profile and stopped after the last one (unless it was already tracing before).
+memory_profiles = 0
+started_tracing = False
+memory_profiles_lock = Lock()
+
+
+def artifact_path(profile_id: str, artifact: str) -> str:
+    """
+    Computes where an artifact of a profile is saved.
+
+    :param profile_id: The id of the profile.
+    :param artifact: "cpu" for the cProfile data (readable with pstats or snakeviz) or
+        "summary" for the slowest functions and the top allocations as text.
+    :return: The path of the file.
+    """
+    return os.path.join(PROFILES_DIRECTORY, artifacts[artifact].format(profile_id))
+
+
+def saved_artifact(profile_id: str, artifact: str) -> str | None:
+    """
+    Locates an artifact of a saved profile.
+
+    :param profile_id: The id of the profile.
+    :param artifact: See artifact_path.
+    :return: The path of the file, or None if there is no such profile or artifact.
+    """
+    if artifact not in artifacts or os.path.basename(profile_id) != profile_id:
+        return None
+    path = artifact_path(profile_id, artifact)
+    return path if os.path.isfile(path) else None
+
+
+def profile_call(
+    profile_id: str,
+    trace_memory: bool,
+    function: Callable[..., Any],
+    *args: Any,
+    **kwargs: Any,
+) -> Any:
+    """
+    Calls a function under cProfile (and optionally tracemalloc) and saves the profile
+    under PROFILES_DIRECTORY. Only the calling thread is profiled, but allocations of
+    other threads are traced as well.
+
+    :param profile_id: The id to save the profile as.
+    :param trace_memory: Whether to also record the top allocations.
+    :param function: The function to call.
+    :param args: The arguments of the function.
+    :param kwargs: The keyword arguments of the function.
+    :return: The return value of the function.
+    """
+    if trace_memory:
+        start_memory_profile()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        snapshot = stop_memory_profile() if trace_memory else None
+        os.makedirs(PROFILES_DIRECTORY, exist_ok=True)
+        profiler.dump_stats(artifact_path(profile_id, "cpu"))
+        with open(artifact_path(profile_id, "summary"), "w") as f:
+            f.write(profile_summary(profiler, snapshot))
+
+
+def start_memory_profile() -> None:
+    """
+    Registers a running memory profile and starts tracemalloc if necessary.
+
+    :return:
+    """
+    global memory_profiles, started_tracing
+    with memory_profiles_lock:
+        if memory_profiles == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        memory_profiles += 1
+
+
+def stop_memory_profile() -> tracemalloc.Snapshot:
+    """
+    Takes a snapshot for a finished memory profile and stops tracemalloc if no other
+    memory profile is running and it was started by start_memory_profile.
+
+    :return: The snapshot of the traced allocations.
+    """
+    global memory_profiles, started_tracing
+    with memory_profiles_lock:
+        snapshot = tracemalloc.take_snapshot()
+        memory_profiles -= 1
+        if memory_profiles == 0 and started_tracing:
+            tracemalloc.stop()
+            started_tracing = False
+    return snapshot
+
+
+def profile_summary(
+    profiler: cProfile.Profile,
+    snapshot: tracemalloc.Snapshot | None,
+    limit: int = 30,
+) -> str:
+    """
+    Summarizes a profile as text: the functions with the highest cumulative time and,
+    if memory was traced, the source lines that allocated the most memory.
+
+    :param profiler: The profiler.
+    :param snapshot: The tracemalloc snapshot, or None.
+    :param limit: How many functions and source lines to list.
+    :return: The summary.
+    """
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(limit)
+    if snapshot is not None:
+        stream.write(f"\nTop {limit} allocations by source line:\n")
+        for statistic in snapshot.statistics("lineno")[:limit]:
+            stream.write(f"{statistic}\n")
+    return stream.getvalue()
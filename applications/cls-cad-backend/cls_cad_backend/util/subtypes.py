@@ -0,0 +1,69 @@
+from collections.abc import Collection, Iterable
+from itertools import chain
+
+from clsp import Subtypes
+
+
+class Taxonomy(Subtypes):
+    """
+    The subtype environment used by clsp, which additionally precomputes the
+    reflexive-transitive closure of the taxonomy as bitsets. The backend only compares
+    type names (constructors without arguments), so it checks subtypes on the closure
+    in constant time per name instead of using check_subtype.
+    """
+
+    def __init__(self, environment: dict[str, list[str]]) -> None:
+        """
+        Creates the environment and computes the closure.
+
+        :param environment: The merged taxonomy, mapping each type name to its direct
+            supertypes, see suffix_and_merge_taxonomy.
+        """
+        super().__init__(environment)
+        names = chain(environment, chain.from_iterable(environment.values()))
+        self.bits: dict[str, int] = {}
+        for name in names:
+            self.bits.setdefault(name, 1 << len(self.bits))
+        # The bits of each name and all its supertypes. Propagating the supertypes of
+        # direct supertypes until nothing changes takes as many rounds as the taxonomy
+        # is deep, and also terminates for cyclic taxonomies.
+        self.supertypes: dict[str, int] = dict(self.bits)
+        changed = True
+        while changed:
+            changed = False
+            for name, direct_supertypes in environment.items():
+                reachable = self.supertypes[name]
+                for supertype in direct_supertypes:
+                    reachable |= self.supertypes[supertype]
+                if reachable != self.supertypes[name]:
+                    self.supertypes[name] = reachable
+                    changed = True
+
+    def is_subtype(self, subtype: str, supertype: str) -> bool:
+        """
+        Checks whether a type name is a subtype of another.
+
+        :param subtype: The suffixed name of the subtype.
+        :param supertype: The suffixed name of the supertype.
+        :return: True if the taxonomy relates the names (or they are equal).
+        """
+        return self.satisfies((subtype,), (supertype,))
+
+    def satisfies(self, provided: Collection[str], required: Iterable[str]) -> bool:
+        """
+        Checks whether an intersection of type names is a subtype of another, i.e.,
+        whether for each required type some provided type is a subtype of it. Names
+        that are not part of the taxonomy are only subtypes of themselves.
+
+        :param provided: The names of the intersected subtypes.
+        :param required: The names of the intersected supertypes.
+        :return: True if the provided types satisfy all required types.
+        """
+        reachable = 0
+        for name in provided:
+            reachable |= self.supertypes.get(name, 0)
+        for name in required:
+            bit = self.bits.get(name)
+            if not (name in provided if bit is None else reachable & bit):
+                return False
+        return True
@@ -1,5 +1,17 @@
+from collections import defaultdict
+
 import cls_cad_backend.server
 import pytest
+from cls_cad_backend.database import commands
+from cls_cad_backend.database.commands import (
+    declared_indexes,
+    get_result_chunks,
+    get_result_for_id_in_project,
+    get_result_header_for_id_in_project,
+    results_summarized,
+    upsert_result,
+)
+from cls_cad_backend.settings import RESULT_CHUNK_SIZE
 from fastapi.testclient import TestClient
 
 client = TestClient(cls_cad_backend.server.app)
@@ -145,3 +157,123 @@ def test_fetch_taxonomy():
     response = client.get("/data/taxonomy/forgeProject")
     assert response.status_code == 200
     assert len(response.json()["taxonomies"]["parts"]["Part"]) == 1
+
+
+@pytest.mark.order(28)
+def test_results_are_stored_in_chunks():
+    assemblies = [{"cost": i} for i in range(RESULT_CHUNK_SIZE + 1)]
+    upsert_result(
+        {
+            "_id": "chunked",
+            "forgeProjectId": "chunkProject",
+            "interpretedTerms": assemblies,
+        }
+    )
+    header = get_result_header_for_id_in_project("chunked", "chunkProject")
+    assert "interpretedTerms" not in header
+    assert header["count"] == RESULT_CHUNK_SIZE + 1
+    assert get_result_chunks("chunked", "chunkProject", [1]) == {1: assemblies[-1:]}
+    result = get_result_for_id_in_project("chunked", "chunkProject")
+    assert result["interpretedTerms"] == assemblies
+
+
+@pytest.mark.dependency(depends=["test_upsert_parts"])
+@pytest.mark.order(39)
+def test_type_index():
+    response = client.get("/data/types/forgeProject")
+    assert response.status_code == 200
+    assert response.json()["provides"]["Cube_parts"] == 3
+
+    response = client.get("/data/types/forgeProject/Cube_parts")
+    assert response.status_code == 200
+    assert {origin["partId"] for origin in response.json()} == {"1", "2", "3"}
+
+    response = client.get("/data/types/forgeProject/Cube_parts?role=invalid")
+    assert response.status_code == 422
+
+
+@pytest.mark.order(46)
+def test_type_index_with_repeated_types():
+    test_payload = {
+        "_id": "repeated",
+        "configurations": [{"requiresJointOrigins": ["a"], "providesJointOrigin": "b"}],
+        "meta": {
+            "name": "Repeated Types",
+            "forgeDocumentId": "repeated",
+            "forgeFolderId": "forgeFolder",
+            "forgeProjectId": "repeatedProject",
+            "cost": 1.0,
+            "availability": 1.0,
+        },
+        "jointOrigins": {
+            "a": {
+                "motion": "Rigid",
+                "count": 1,
+                "requires": ["Cube_parts", "Cube_parts"],
+                "provides": [],
+            },
+            "b": {
+                "motion": "Rigid",
+                "count": 1,
+                "requires": [],
+                "provides": ["Cube_parts", "Square_formats", "Cube_parts"],
+            },
+        },
+    }
+    response = client.post("/submit/part", json=test_payload)
+    assert response.status_code == 200
+    response = client.post("/submit/part", json=test_payload)
+    assert response.status_code == 200
+
+    response = client.get("/data/types/repeatedProject")
+    assert response.json()["provides"] == {"Cube_parts": 1, "Square_formats": 1}
+    assert response.json()["requires"] == {"Cube_parts": 1}
+
+
+@pytest.mark.order(49)
+def test_results_without_summaries_are_summarized_once():
+    upsert_result(
+        {
+            "_id": "unsummarized",
+            "forgeProjectId": "summaryProject",
+            "timestamp": 1.0,
+            "interpretedTerms": [{"cost": 2, "count": 1, "links": 0, "quantities": {}}],
+        }
+    )
+    assert not results_summarized("summaryProject")
+    response = client.get("/results/summaryProject")
+    assert [summary["id"] for summary in response.json()] == ["unsummarized"]
+    assert response.json()[0]["costRange"] == {"min": 2, "max": 2}
+    assert results_summarized("summaryProject")
+
+
+class RecordingCollection:
+    def __init__(self) -> None:
+        self.indexes = []
+
+    def create_index(self, keys) -> None:
+        self.indexes.append(keys)
+
+
+@pytest.mark.order(50)
+def test_declared_indexes(monkeypatch):
+    database = commands.database
+    recorded = defaultdict(RecordingCollection)
+    try:
+        commands.bind_collections(recorded)
+    finally:
+        commands.bind_collections(database)
+    indexes = {name: c.indexes for name, c in recorded.items() if c.indexes}
+    assert indexes == declared_indexes
+
+    for path in ("/admin/indexes", "/admin/caches"):
+        assert client.get(path).json() == "Invalid"
+    assert client.post("/admin/migrate/results").json() == "Invalid"
+
+    monkeypatch.setattr(cls_cad_backend.server, "ADMIN_ENABLED", True)
+    report = client.get("/admin/indexes").json()
+    assert set(report["collections"]) == set(declared_indexes)
+    for name, indexes in declared_indexes.items():
+        declared = [dict(keys) for keys in indexes]
+        assert report["collections"][name]["declared"] == declared
+    assert "results" in client.get("/admin/caches").json()
@@ -122,3 +122,62 @@ def test_for_invidual_results():
     response = client.get(f"/results/forgeProject/{result}/999")
     assert response.status_code == 200
     assert response.json() == ""
+
+
+@pytest.mark.dependency(
+    depends=["tests/test_synthesis.py::test_synthesis_intersection_counting"],
+    scope="session",
+)
+@pytest.mark.order(27)
+def test_pretty_results_match_compact_results():
+    response = client.get("/results/forgeProject")
+    result = response.json()[0]["id"]
+    compact = client.get(f"/results/forgeProject/{result}?limit=2")
+    pretty = client.get(f"/results/forgeProject/{result}?limit=2&pretty=true")
+    assert b"\n" not in compact.content and b"\n" in pretty.content
+    assert compact.json() == pretty.json()
+    single = client.get(f"/results/forgeProject/{result}/1")
+    assert single.json() == compact.json()[1]
+
+
+@pytest.mark.dependency(
+    depends=["tests/test_synthesis.py::test_synthesis_intersection_counting"],
+    scope="session",
+)
+@pytest.mark.order(31)
+def test_results_are_compressed_if_accepted():
+    response = client.get("/results/forgeProject")
+    result = response.json()[0]["id"]
+    plain = client.get(
+        f"/results/forgeProject/{result}", headers={"Accept-Encoding": "identity"}
+    )
+    assert "content-encoding" not in plain.headers
+    compressed = client.get(
+        f"/results/forgeProject/{result}", headers={"Accept-Encoding": "gzip"}
+    )
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.json() == plain.json()
+
+
+@pytest.mark.dependency(
+    depends=["tests/test_synthesis.py::test_synthesis_intersection_counting"],
+    scope="session",
+)
+@pytest.mark.order(32)
+def test_unchanged_results_are_not_sent_again():
+    response = client.get("/results/forgeProject")
+    result = response.json()[0]["id"]
+    response = client.get(f"/results/forgeProject/{result}")
+    assert "immutable" in response.headers["cache-control"]
+    response = client.get(
+        f"/results/forgeProject/{result}",
+        headers={"If-None-Match": response.headers["etag"]},
+    )
+    assert response.status_code == 304
+
+    response = client.get("/data/taxonomy/forgeProject")
+    response = client.get(
+        "/data/taxonomy/forgeProject",
+        headers={"If-None-Match": response.headers["etag"]},
+    )
+    assert response.status_code == 304
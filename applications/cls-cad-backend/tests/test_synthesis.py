@@ -1,4 +1,10 @@
+import asyncio
+import json
+import threading
+import time
+
 import cls_cad_backend.server
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 
@@ -124,3 +130,337 @@ def test_synthesis_intersection_fail():
     response = client.post("/request/assembly", json=test_payload)
     assert response.status_code == 200
     assert response.text == '"FAIL"'
+
+
+@pytest.mark.dependency(
+    depends=[
+        "tests/test_database.py::test_upsert_taxonomy",
+        "tests/test_database.py::test_upsert_parts",
+    ],
+    scope="session",
+)
+@pytest.mark.order(19)
+def test_synthesis_async_job():
+    test_payload = {
+        "forgeProjectId": "forgeProject",
+        "target": ["Cube_parts"],
+        "name": "Async Request",
+    }
+    response = client.post("/request/assembly?async=1", json=test_payload)
+    assert response.status_code == 200
+    job_id = response.json()["_id"]
+
+    for _ in range(600):
+        response = client.get(f"/jobs/{job_id}")
+        if response.json()["status"] in ("done", "failed", "cancelled"):
+            break
+        time.sleep(0.1)
+    assert response.json()["status"] == "done"
+    assert response.json()["result"]["count"] == 100
+
+    response = client.get(f"/jobs/nonexistent")
+    assert response.text == '"Invalid"'
+    response = client.post(f"/jobs/nonexistent/cancel")
+    assert response.text == '"Invalid"'
+
+
+@pytest.mark.dependency(
+    depends=[
+        "tests/test_database.py::test_upsert_taxonomy",
+        "tests/test_database.py::test_upsert_parts",
+    ],
+    scope="session",
+)
+@pytest.mark.order(20)
+def test_synthesis_stream():
+    test_payload = {
+        "forgeProjectId": "forgeProject",
+        "target": ["Cube_parts"],
+        "name": "Streamed Request",
+    }
+    response = client.post("/request/assembly/stream", json=test_payload)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["name"] == "Streamed Request"
+    assert len(lines) == 101
+
+    response = client.get(f"/results/forgeProject/{lines[0]['_id']}")
+    assert len(response.json()) == 100
+
+
+@pytest.mark.dependency(
+    depends=[
+        "tests/test_database.py::test_upsert_taxonomy",
+        "tests/test_database.py::test_upsert_parts",
+    ],
+    scope="session",
+)
+@pytest.mark.order(21)
+def test_synthesis_cursor():
+    test_payload = {
+        "forgeProjectId": "forgeProject",
+        "target": ["Cube_parts"],
+        "name": "Paged Request",
+        "pageSize": 10,
+    }
+    response = client.post("/request/assembly", json=test_payload)
+    assert response.status_code == 200
+    assert response.json()["count"] == 10
+    cursor = response.json()["cursor"]
+
+    response = client.post(f"/request/assembly/next/{cursor}?limit=5")
+    assert response.status_code == 200
+    assert response.json()["count"] == 5
+    assert response.json()["offset"] == 10
+    assert response.json()["cursor"] == cursor
+
+    response = client.post("/request/assembly/next/nonexistent")
+    assert response.text == '"Invalid"'
+
+
+@pytest.mark.dependency(
+    depends=[
+        "tests/test_database.py::test_upsert_taxonomy",
+        "tests/test_database.py::test_upsert_parts",
+    ],
+    scope="session",
+)
+@pytest.mark.order(22)
+def test_synthesis_ranked_by_cost():
+    test_payload = {
+        "forgeProjectId": "forgeProject",
+        "target": ["Cube_parts"],
+        "name": "Ranked Request",
+        "pageSize": 5,
+        "rankBy": "cost",
+    }
+    response = client.post("/request/assembly", json=test_payload)
+    assert response.status_code == 200
+    assert response.json()["count"] == 5
+    assert "cursor" not in response.json()
+
+    response = client.get(f"/results/forgeProject/{response.json()['_id']}")
+    costs = [assembly["cost"] for assembly in response.json()]
+    assert costs == sorted(costs)
+    assert costs[0] == 1.0
+
+
+@pytest.mark.dependency(
+    depends=[
+        "tests/test_database.py::test_upsert_taxonomy",
+        "tests/test_database.py::test_upsert_parts",
+    ],
+    scope="session",
+)
+@pytest.mark.order(33)
+def test_synthesis_identical_request_is_reused():
+    test_payload = {
+        "forgeProjectId": "forgeProject",
+        "target": ["Cube_parts", "Plastic_attributes"],
+        "name": "Reused Request",
+    }
+    first = client.post("/request/assembly", json=test_payload).json()
+    second = client.post("/request/assembly", json=test_payload).json()
+    assert second["reused"] and second["_id"] == first["_id"]
+    assert second["count"] == first["count"]
+
+    forced = client.post("/request/assembly?force=1", json=test_payload).json()
+    assert "reused" not in forced and forced["_id"] != first["_id"]
+
+
+@pytest.mark.dependency(
+    depends=[
+        "tests/test_database.py::test_upsert_taxonomy",
+        "tests/test_database.py::test_upsert_parts",
+    ],
+    scope="session",
+)
+@pytest.mark.order(34)
+def test_synthesis_concurrent_identical_requests_are_coalesced():
+    test_payload = {
+        "forgeProjectId": "forgeProject",
+        "target": ["Cube_parts", "Square_formats"],
+        "name": "Coalesced Request",
+    }
+
+    async def post_twice():
+        transport = httpx.ASGITransport(app=cls_cad_backend.server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            return await asyncio.gather(
+                c.post("/request/assembly?force=1", json=test_payload),
+                c.post("/request/assembly?force=1", json=test_payload),
+            )
+
+    first, second = (response.json() for response in asyncio.run(post_twice()))
+    assert first["_id"] == second["_id"]
+    assert second["coalesced"] and "cursor" not in second
+
+    first = client.post("/request/assembly?async=1&force=1", json=test_payload)
+    second = client.post("/request/assembly?async=1&force=1", json=test_payload)
+    assert first.json()["_id"] == second.json()["_id"]
+
+
+@pytest.mark.dependency(
+    depends=[
+        "tests/test_database.py::test_upsert_taxonomy",
+        "tests/test_database.py::test_upsert_parts",
+    ],
+    scope="session",
+)
+@pytest.mark.order(38)
+def test_synthesis_infeasible_request_fails_fast():
+    test_payload = {
+        "forgeProjectId": "forgeProject",
+        "target": ["Cube_parts"],
+        "name": "Infeasible Request",
+        "partCounts": [
+            {
+                "partNumber": 2,
+                "partCountName": "Sphere Count",
+                "partType": ["Sphere_parts"],
+            }
+        ],
+    }
+    response = client.post("/request/assembly/feasibility", json=test_payload)
+    assert not response.json()["feasible"]
+    assert response.json()["unsatisfiable"][0]["partCount"] == "Sphere Count"
+
+    response = client.post("/request/assembly", json=test_payload)
+    assert response.text == '"FAIL"'
+    assert "Sphere Count" in response.headers["X-Infeasible"]
+
+    test_payload = {"forgeProjectId": "forgeProject", "target": ["Cube_parts"]}
+    response = client.post("/request/assembly/feasibility", json=test_payload)
+    assert response.json() == {"feasible": True, "unsatisfiable": []}
+
+
+@pytest.mark.dependency(
+    depends=[
+        "tests/test_database.py::test_upsert_taxonomy",
+        "tests/test_database.py::test_upsert_parts",
+    ],
+    scope="session",
+)
+@pytest.mark.order(41)
+def test_jobs_can_be_queried_after_shutdown():
+    test_payload = {
+        "forgeProjectId": "forgeProject",
+        "target": ["Cube_parts"],
+        "name": "Shutdown Request",
+        "pageSize": 3,
+    }
+    response = client.post("/request/assembly?async=1&force=1", json=test_payload)
+    job_id = response.json()["_id"]
+    cls_cad_backend.server.stop_workers()
+
+    response = client.get(f"/jobs/{job_id}")
+    assert response.status_code == 200
+    assert response.json()["status"] in ("done", "failed", "cancelled")
+    response = client.post(f"/jobs/{job_id}/cancel")
+    assert response.status_code == 200
+    assert response.json()["status"] in ("done", "failed", "cancelled")
+
+
+@pytest.mark.order(44)
+def test_synthesis_follower_survives_cancelled_leader(monkeypatch):
+    test_payload = {
+        "forgeProjectId": "forgeProject",
+        "target": ["Cube_parts", "Square_formats"],
+        "name": "Cancelled Request",
+    }
+    release = threading.Event()
+
+    def slow_synthesis(payload, fingerprint, request_id):
+        release.wait(timeout=10)
+        return None, None
+
+    monkeypatch.setattr(cls_cad_backend.server, "run_synthesis", slow_synthesis)
+
+    async def cancel_leader():
+        transport = httpx.ASGITransport(app=cls_cad_backend.server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+            leader = asyncio.create_task(
+                c.post("/request/assembly?force=1", json=test_payload)
+            )
+            while not cls_cad_backend.server.in_flight:
+                await asyncio.sleep(0.01)
+            follower = asyncio.create_task(
+                c.post("/request/assembly?force=1", json=test_payload)
+            )
+            await asyncio.sleep(0.1)
+            leader.cancel()
+            await asyncio.sleep(0.1)
+            release.set()
+            await asyncio.gather(leader, return_exceptions=True)
+            return await asyncio.wait_for(follower, timeout=10)
+
+    response = asyncio.run(cancel_leader())
+    assert response.text == '"FAIL"'
+    assert not cls_cad_backend.server.in_flight
+
+
+@pytest.mark.order(48)
+def test_synthesis_unfinished_stream_is_not_stored(monkeypatch):
+    server = cls_cad_backend.server
+    stored = []
+    monkeypatch.setattr(server, "project_taxonomy", lambda project_id: None)
+    monkeypatch.setattr(
+        server.RepositoryBuilder, "cached_repository", lambda *args, **kwargs: {}
+    )
+    monkeypatch.setattr(
+        server,
+        "iterate_synthesis",
+        lambda *args, **kwargs: iter([{"name": "A"}, {"name": "B"}]),
+    )
+    monkeypatch.setattr(server, "store_result", stored.append)
+    payload = server.SynthesisRequestInf(
+        forgeProjectId="forgeProject", target=["Cube_parts"], name="Streamed Request"
+    )
+
+    async def stream(line_count):
+        response = await server.stream_assembly(payload)
+        lines = []
+        async for line in response.body_iterator:
+            lines.append(line)
+            if len(lines) == line_count:
+                break
+        await response.background()
+        return lines
+
+    assert len(asyncio.run(stream(2))) == 2
+    assert stored == []
+    assert len(asyncio.run(stream(None))) == 3
+    assert [len(result["interpretedTerms"]) for result in stored] == [2]
+
+
+@pytest.mark.dependency(
+    depends=[
+        "tests/test_database.py::test_upsert_taxonomy",
+        "tests/test_database.py::test_upsert_parts",
+    ],
+    scope="session",
+)
+@pytest.mark.order(52)
+def test_synthesis_ranked_counting():
+    test_payload = {
+        "forgeProjectId": "forgeProject",
+        "target": ["Cube_parts"],
+        "name": "Ranked Counting Request",
+        "pageSize": 5,
+        "rankBy": "cost",
+        "partCounts": [
+            {
+                "partNumber": 5,
+                "partCountName": "Ranked Count",
+                "partType": ["Cube_parts"],
+            }
+        ],
+    }
+    response = client.post("/request/assembly", json=test_payload)
+    assert response.status_code == 200
+    assert response.json()["count"] == 3
+
+    response = client.get(f"/results/forgeProject/{response.json()['_id']}")
+    costs = [assembly["cost"] for assembly in response.json()]
+    assert costs == sorted(costs)
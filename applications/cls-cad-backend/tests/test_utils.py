@@ -1,5 +1,35 @@
+import gc
+import json
+import pickle
+import threading
+import tracemalloc
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from types import SimpleNamespace
+
 import pytest
+from cls_cad_backend import jobs, synthesis
+from cls_cad_backend.database.codec import (
+    decode_assemblies,
+    decode_assembly_bytes,
+    encode_assemblies,
+)
+from cls_cad_backend.ranking import ranked_terms, rankings
+from cls_cad_backend.repository_builder import (
+    Part,
+    PartClass,
+    RepositoryBuilder,
+    normalize_part_counts,
+    relevant_parts,
+)
+from cls_cad_backend.responses import negotiate_encoding, negotiate_media_type
+from cls_cad_backend.util import profiling
+from cls_cad_backend.util.cache import LRUCache
+from cls_cad_backend.util.json_encoding import json_bytes
+from cls_cad_backend.util.json_operations import summarize_assemblies
+from cls_cad_backend.util.metrics import Histogram, record_size, render, timed, traced
 from cls_cad_backend.util.motion import combine_motions
+from cls_cad_backend.util.subtypes import Taxonomy
 
 
 @pytest.mark.order(16)
@@ -12,3 +42,432 @@ def test_combine_motions():
     assert result == "Any"
     result = combine_motions("Any", "AnythingElse")
     assert result == "Ball"
+
+
+@pytest.mark.order(17)
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert "a" in cache and "c" in cache and "b" not in cache
+    assert cache.get_or_compute("d", lambda: 4) == 4
+    assert len(cache) == 2
+    cache.invalidate(lambda key: key == "d")
+    assert "d" not in cache
+
+
+@pytest.mark.order(25)
+def test_lru_cache_respects_byte_budget():
+    cache = LRUCache(10, max_bytes=5, size_of=len)
+    cache.put("a", "abc")
+    cache.put("b", "cd")
+    assert cache.bytes == 5
+    cache.put("c", "e")
+    assert "a" not in cache and cache.bytes == 3
+    cache.put("d", "too large")
+    assert "d" not in cache
+    cache.get("b")
+    cache.get("a")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 1, 1)
+
+
+@pytest.mark.order(18)
+def test_repository_cache_key_ignores_requested_numbers():
+    assert normalize_part_counts(None) == ()
+    assert normalize_part_counts(
+        [(["B_parts", "A_parts"], 3, "Count")]
+    ) == normalize_part_counts([(["A_parts", "B_parts"], 5, "Count")])
+
+
+def equivalent_part(part_id: str, cost: float) -> dict:
+    return {
+        "_id": part_id,
+        "configurations": [
+            {
+                "requiresJointOrigins": [f"a{part_id}"],
+                "providesJointOrigin": f"b{part_id}",
+            }
+        ],
+        "meta": {
+            "name": f"Screw {part_id}",
+            "forgeDocumentId": part_id,
+            "forgeFolderId": "forgeFolder",
+            "forgeProjectId": "forgeProject",
+            "cost": cost,
+            "availability": 1.0,
+        },
+        "jointOrigins": {
+            f"a{part_id}": {
+                "motion": "Rigid",
+                "count": 1,
+                "requires": ["Square_formats"],
+                "provides": [],
+            },
+            f"b{part_id}": {
+                "motion": "Rigid",
+                "count": 1,
+                "requires": [],
+                "provides": ["Cube_parts"],
+            },
+        },
+    }
+
+
+@pytest.mark.order(23)
+def test_equivalent_parts_are_grouped():
+    repository = RepositoryBuilder.add_parts_to_repository(
+        [equivalent_part("1", 2.0), equivalent_part("2", 1.0)], Taxonomy({})
+    )
+    assert len(repository) == 1
+    (part_class,) = repository
+    assert isinstance(part_class, PartClass)
+    assert part_class.info["forgeDocumentId"] == "2"
+    assert part_class.info["alternatives"] == ("1",)
+    assert json.loads(json_bytes(part_class()))["alternatives"] == ["1"]
+
+
+@pytest.mark.order(24)
+def test_parts_are_immutable_and_interned():
+    info = {"name": "Cube", "requiredJointOriginsInfo": {"a": {"requires": ["X"]}}}
+    part, same_part = Part(info), Part(dict(info))
+    assert part == same_part and hash(part) == hash(same_part)
+    assert part.info is same_part.info
+    assert pickle.loads(pickle.dumps(part)) == part
+    with pytest.raises(AttributeError):
+        part.info = {}
+    with pytest.raises(TypeError):
+        part.info["name"] = "Sphere"
+
+    infos = [Part({"name": f"Part {index}"}).info for index in range(1000)]
+    assert len(Part._interned_infos) >= 1000
+    del infos, part, same_part
+    gc.collect()
+    assert len(Part._interned_infos) < 1000
+
+
+@pytest.mark.order(26)
+def test_summarize_assemblies():
+    summary = summarize_assemblies(
+        [
+            {"cost": 2, "count": 3, "links": 1, "quantities": {"a": {"count": 2}}},
+            {"cost": 5, "count": 1, "links": 2, "quantities": {"a": {"count": 1}}},
+        ]
+    )
+    assert summary["maxCounts"] == {"a": 2}
+    assert summary["partFrequency"] == {"a": 2}
+    assert summary["costRange"] == {"min": 2, "max": 5}
+    assert summarize_assemblies([])["countRange"] is None
+
+
+@pytest.mark.order(29)
+@pytest.mark.parametrize("codec", ["none", "zlib", "zstd"])
+def test_result_codecs_round_trip(codec):
+    assemblies = [{"name": "A\nB", "count": 1}, {"name": "C", "count": 2}]
+    chunk = encode_assemblies(assemblies, codec)
+    assert decode_assemblies(chunk) == assemblies
+    assert decode_assembly_bytes(chunk)[1] == b'{"name":"C","count":2}'
+    assert decode_assemblies(encode_assemblies([], codec)) == []
+
+
+@pytest.mark.order(30)
+def test_content_negotiation():
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0, identity") is None
+    assert negotiate_encoding("") is None
+    assert negotiate_media_type("application/json, */*") == "application/json"
+
+
+@pytest.mark.order(35)
+def test_phase_timing_metrics():
+    with traced("test-request") as trace:
+        with timed("inhabit"):
+            pass
+        with timed("inhabit"):
+            pass
+        record_size("literals", {"a": 3, "b": 12})
+    assert list(trace.phases) == ["inhabit"]
+    with timed("inhabit"):
+        pass
+    assert list(trace.phases) == ["inhabit"]
+
+    metrics = []
+    histogram = Histogram("test_seconds", "Test histogram.", (1, 10), metrics)
+    histogram.observe(0.5, phase="a")
+    histogram.observe(5, phase="a")
+    histogram.observe(50, phase="a")
+    lines = histogram.exposition()
+    assert 'test_seconds_bucket{phase="a",le="1.0"} 1' in lines
+    assert 'test_seconds_bucket{phase="a",le="10.0"} 2' in lines
+    assert 'test_seconds_bucket{phase="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{phase="a"} 3' in lines
+    assert "# TYPE test_seconds histogram" in render(metrics)
+    assert "test_seconds" not in render()
+
+
+@pytest.mark.order(36)
+def test_profile_call(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILES_DIRECTORY", str(tmp_path))
+    assert profiling.profile_call("profile", True, sorted, [3, 1, 2]) == [1, 2, 3]
+    reversed_values = profiling.profile_call(
+        "other", False, sorted, [1, 3], reverse=True
+    )
+    assert reversed_values == [3, 1]
+    assert profiling.saved_artifact("profile", "cpu").endswith("profile.prof")
+    with open(profiling.saved_artifact("profile", "summary")) as f:
+        assert "allocations" in f.read()
+    assert profiling.saved_artifact("missing", "cpu") is None
+    assert profiling.saved_artifact("../profile", "cpu") is None
+
+
+def typed_part(part_id: str, provides: list[str], requires: list[list[str]]) -> dict:
+    joint_origins = {
+        f"{part_id}-{index}": {
+            "motion": "Rigid",
+            "count": 1,
+            "requires": required,
+            "provides": [],
+        }
+        for index, required in enumerate(requires)
+    }
+    joint_origins[f"{part_id}-provides"] = {
+        "motion": "Rigid",
+        "count": 1,
+        "requires": [],
+        "provides": provides,
+    }
+    return dict(
+        equivalent_part(part_id, 1.0),
+        configurations=[
+            {
+                "requiresJointOrigins": list(joint_origins)[:-1],
+                "providesJointOrigin": f"{part_id}-provides",
+            }
+        ],
+        jointOrigins=joint_origins,
+    )
+
+
+@pytest.mark.order(37)
+def test_irrelevant_parts_are_pruned():
+    parts = [
+        typed_part("frame", ["Frame_parts"], [["Wheel_parts"]]),
+        typed_part("wheel", ["Wheel_parts", "Round_formats"], []),
+        typed_part("lamp", ["Lamp_parts"], []),
+        typed_part("broken", ["Frame_parts"], [["Motor_parts"]]),
+    ]
+    relevant = relevant_parts(parts, ["Frame_parts"], Taxonomy({}))
+    assert [part["_id"] for part in relevant] == ["frame", "wheel"]
+    relevant = relevant_parts(parts, ["Wheel_parts", "Round_formats"], Taxonomy({}))
+    assert [part["_id"] for part in relevant] == ["wheel"]
+    assert relevant_parts(parts, ["Motor_parts"], Taxonomy({})) == []
+
+
+@pytest.mark.order(40)
+def test_subtype_closure():
+    taxonomy = Taxonomy(
+        {
+            "Cube_parts": ["Box_parts"],
+            "Box_parts": ["Part_parts"],
+            "Loop_parts": ["Ring_parts"],
+            "Ring_parts": ["Loop_parts"],
+        }
+    )
+    assert taxonomy.is_subtype("Cube_parts", "Part_parts")
+    assert taxonomy.is_subtype("Cube_parts", "Cube_parts")
+    assert not taxonomy.is_subtype("Part_parts", "Cube_parts")
+    assert taxonomy.is_subtype("Loop_parts", "Ring_parts")
+    assert taxonomy.is_subtype("Ring_parts", "Loop_parts")
+    assert taxonomy.is_subtype("Unknown_parts", "Unknown_parts")
+    assert not taxonomy.is_subtype("Unknown_parts", "Part_parts")
+
+    assert taxonomy.satisfies(["Cube_parts", "Red_attributes"], ["Part_parts"])
+    assert taxonomy.satisfies(
+        ["Cube_parts", "Red_attributes"], ["Box_parts", "Red_attributes"]
+    )
+    assert not taxonomy.satisfies(["Cube_parts"], ["Box_parts", "Red_attributes"])
+    assert taxonomy.satisfies(["Cube_parts"], [])
+
+
+@pytest.mark.order(42)
+def test_concurrent_pages_of_a_cursor(monkeypatch):
+    monkeypatch.setattr(
+        synthesis, "enumerate_terms", lambda query, grammar, max_count: iter(range(20))
+    )
+    monkeypatch.setattr(
+        synthesis, "interpret_terms", lambda terms, parallel: list(terms)
+    )
+    cursor = synthesis.EnumerationCursor(None, None, None)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        pages = list(executor.map(cursor.next_page, [5] * 4))
+    assert sorted(offset for offset, _ in pages) == [0, 5, 10, 15]
+    for offset, page in pages:
+        assert page == list(range(offset, offset + 5))
+    assert cursor.exhausted
+
+
+def ranked_part(name: str, cost: float, availability: float, counts: list[int]) -> Part:
+    return Part(
+        {
+            "name": name,
+            "cost": cost,
+            "availability": availability,
+            "motion": "Rigid",
+            "requiredJointOriginsInfo": {
+                f"{name}-{index}": {"count": count, "motion": "Rigid"}
+                for index, count in enumerate(counts)
+            },
+        }
+    )
+
+
+def assembly_cost(term) -> float:
+    part, arguments = term
+    return part.info["cost"] + sum(
+        joint_origin_info["count"] * assembly_cost(argument)
+        for joint_origin_info, argument in zip(
+            part.info["requiredJointOriginsInfo"].values(), arguments
+        )
+    )
+
+
+@pytest.mark.order(43)
+def test_ranked_terms_best_first():
+    a = ranked_part("A", 1.0, 0.9, [2])
+    b = ranked_part("B", 10.0, 1.0, [])
+    c = ranked_part("C", 3.0, 0.5, [])
+    d = ranked_part("D", 1.0, 0.2, [])
+    e = ranked_part("E", 0.5, 0.8, [1])
+    grammar = {
+        "Top": [(a, ["Mid"]), (b, [])],
+        "Mid": [(c, []), (d, []), (e, ["Mid"])],
+        "Unreachable": [(b, ["Missing"])],
+    }
+
+    terms = list(islice(ranked_terms("Top", grammar, rankings["cost"]), 5))
+    assert [assembly_cost(term) for term in terms] == [3.0, 4.0, 5.0, 6.0, 7.0]
+    assert terms[0] == (a, ((d, ()),))
+    assert terms[1] == (a, ((e, ((d, ()),)),))
+    assert len(set(terms)) == len(terms)
+
+    terms = list(islice(ranked_terms("Top", grammar, rankings["availability"]), 3))
+    assert terms[0] == (b, ())
+    assert terms[1] == (a, ((c, ()),))
+    assert terms[2] == (a, ((e, ((c, ()),)),))
+    assert list(ranked_terms("Unreachable", grammar, rankings["cost"])) == []
+
+    counted = SimpleNamespace(
+        terminal=a, parameters=[SimpleNamespace(value=2)], args=["Mid"]
+    )
+    terms = ranked_terms("Top", {**grammar, "Top": [counted]}, rankings["cost"])
+    assert next(terms) == (a, ((2, ()), (d, ())))
+
+
+@pytest.mark.order(51)
+def test_ranked_terms_with_binders_and_predicates():
+    a = ranked_part("A", 1.0, 1.0, [1])
+    b = ranked_part("B", 5.0, 1.0, [])
+    c = ranked_part("C", 2.0, 1.0, [])
+
+    def rule(terminal, predicates, *parameters):
+        return SimpleNamespace(
+            terminal=terminal,
+            binder={"x": "Leaf"},
+            predicates=predicates,
+            parameters=list(parameters),
+            args=[],
+        )
+
+    def count_is(count):
+        return SimpleNamespace(
+            predicate=lambda variables: variables["count"] == count,
+            predicate_substs={"count": 2},
+        )
+
+    grammar = {
+        "Top": [
+            rule(a, [count_is(3)], SimpleNamespace(value=3), SimpleNamespace(name="x")),
+            rule(a, [count_is(2)], SimpleNamespace(value=2), SimpleNamespace(name="x")),
+        ],
+        "Leaf": [(b, []), rule(c, [lambda variables: 1])],
+    }
+    terms = list(ranked_terms("Top", grammar, rankings["cost"]))
+    assert terms == [(a, ((2, ()), (c, ()))), (a, ((2, ()), (b, ())))]
+
+    grammar["Leaf"].append(rule(c, [lambda variables: variables["x"] is not None]))
+    with pytest.raises(ValueError):
+        next(ranked_terms("Top", grammar, rankings["cost"]))
+
+
+@pytest.mark.order(45)
+def test_cursor_page_without_worker_pool(monkeypatch):
+    monkeypatch.setattr(
+        synthesis, "enumerate_terms", lambda query, grammar, max_count: iter(range(100))
+    )
+    calls = []
+    monkeypatch.setattr(
+        synthesis,
+        "interpret_terms",
+        lambda terms, parallel: calls.append(parallel) or list(terms),
+    )
+    cursor = synthesis.EnumerationCursor(None, None, None)
+    assert cursor.next_page(80, parallel=False) == (0, list(range(80)))
+    assert cursor.next_page(10) == (80, list(range(80, 90)))
+    assert calls == [False, True]
+
+
+@pytest.mark.order(47)
+def test_concurrent_memory_profiles(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILES_DIRECTORY", str(tmp_path))
+    both_started, first_done = threading.Barrier(2), threading.Event()
+
+    def first():
+        both_started.wait(timeout=10)
+        return "first"
+
+    def second():
+        both_started.wait(timeout=10)
+        first_done.wait(timeout=10)
+        return "second"
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first_result = executor.submit(profiling.profile_call, "first", True, first)
+        second_result = executor.submit(profiling.profile_call, "second", True, second)
+        assert first_result.result() == "first"
+        first_done.set()
+        assert second_result.result() == "second"
+    for profile_id in ("first", "second"):
+        with open(profiling.saved_artifact(profile_id, "summary")) as f:
+            assert "allocations" in f.read()
+    assert not tracemalloc.is_tracing()
+
+
+class PendingExecutor:
+    def submit(self, *args, **kwargs) -> Future:
+        return Future()
+
+
+@pytest.mark.order(53)
+def test_job_submission_reads_outside_the_lock(monkeypatch):
+    def parts_for_project(project_id):
+        assert not jobs.jobs_lock.locked()
+        return []
+
+    monkeypatch.setattr(jobs, "start_pool", lambda: None)
+    monkeypatch.setattr(jobs, "executor", PendingExecutor())
+    monkeypatch.setattr(jobs, "statuses", {})
+    monkeypatch.setattr(jobs, "cancellations", {})
+    monkeypatch.setattr(jobs, "jobs", {})
+    monkeypatch.setattr(jobs, "get_all_parts_for_project", parts_for_project)
+    monkeypatch.setattr(jobs, "get_taxonomy_for_project", lambda project_id: None)
+    payload = synthesis.SynthesisRequestInf(
+        forgeProjectId="forgeProject", target=["Cube_parts"]
+    )
+
+    job_id = jobs.submit_job(payload, fingerprint="fingerprint")
+    assert jobs.submit_job(payload, fingerprint="fingerprint") == job_id
+    assert jobs.submit_job(payload, fingerprint="other") != job_id
+    assert jobs.statuses[job_id] == jobs.JobStatus.queued.value